@@ -59,6 +59,15 @@ def get_current_model() -> str:
     config = load_config()
     return config.get("llm_model", "gemini")
 
+def get_fallback_model() -> Optional[str]:
+    """Get backup LLM model used when the current model fails (optional)"""
+    config = load_config()
+    model_name = config.get("fallback_llm_model")
+    if model_name and model_name not in config["model_settings"]:
+        print(f"⚠️ Invalid fallback model: {model_name}")
+        return None
+    return model_name
+
 def set_current_model(model_name: str) -> bool:
     """Set current LLM model and save config"""
     config = load_config()
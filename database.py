@@ -1,16 +1,64 @@
+import atexit
 import sqlite3
 import datetime
+import threading
 from typing import Optional, Dict, Any, List
 
+# Số ngày tổng kết cho từng loại thống kê
+_STATS_SUMMARY_DAYS = {'daily': 1, 'weekly': 7, 'monthly': 30}
+
+# PRAGMA chạy một lần khi mở connection: cache 32MB và mmap để các lần đọc sau
+# không phải pread lại. Chỉ áp dụng cho connection - không đổi journal mode của file DB
+_CONNECTION_PRAGMAS = (
+    "PRAGMA cache_size=-32000",
+    "PRAGMA mmap_size=268435456",
+)
+
+
+class _SharedConnection(sqlite3.Connection):
+    """Connection dùng lại giữa các lần gọi
+    
+    close() của các method cũ không đóng thật mà chỉ bỏ phần chưa commit (như đóng rồi mở lại);
+    connection đóng thật qua Database.close() hoặc khi thoát process (atexit).
+    """
+    
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+    
+    def close_connection(self):
+        """Đóng thật connection"""
+        super().close()
+
 
 class Database:
     def __init__(self, db_path: str = "expense_tracker.db"):
         self.db_path = db_path
+        self._local = threading.local()  # Mỗi thread một connection
         self.init_database()
     
+    def _connect(self) -> sqlite3.Connection:
+        """Connection của thread hiện tại - chỉ mở file và chạy PRAGMA lần đầu"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, factory=_SharedConnection)
+            for pragma in _CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            atexit.register(conn.close_connection)
+            self._local.conn = conn
+        return conn
+    
+    def close(self):
+        """Đóng connection của thread hiện tại (lần gọi sau sẽ mở lại)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            atexit.unregister(conn.close_connection)
+            conn.close_connection()
+    
     def init_database(self):
         """Khởi tạo database và tạo các bảng cần thiết"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         # Tạo bảng người dùng
@@ -73,7 +121,7 @@ class Database:
         transaction_type: 'expense' (chi tiêu) hoặc 'income' (thu nhập)
         account_type: 'cash' (tiền mặt) hoặc 'account' (tài khoản ngân hàng)
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         now = datetime.datetime.now()
@@ -100,7 +148,7 @@ class Database:
         cash_amount: số tiền cộng/trừ vào tiền mặt (có thể âm)
         account_amount: số tiền cộng/trừ vào tài khoản (có thể âm)
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -137,12 +185,16 @@ class Database:
     
     def get_user_balance(self, user_id: int = 1) -> Dict[str, float]:
         """Lấy số dư của người dùng"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        conn = self._connect()
+        try:
+            return self._fetch_user_balance(conn.cursor(), user_id)
+        finally:
+            conn.close()
+    
+    def _fetch_user_balance(self, cursor: sqlite3.Cursor, user_id: int = 1) -> Dict[str, float]:
+        """Lấy số dư của người dùng - chạy trên cursor có sẵn"""
         cursor.execute("SELECT cash_balance, account_balance FROM users WHERE id = ?", (user_id,))
         result = cursor.fetchone()
-        conn.close()
         
         if result:
             return {"cash_balance": result[0], "account_balance": result[1]}
@@ -151,7 +203,7 @@ class Database:
     def update_user_balance(self, user_id: int, cash_balance: Optional[float] = None, 
                            account_balance: Optional[float] = None) -> bool:
         """Cập nhật số dư người dùng"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         updates = []
@@ -181,9 +233,34 @@ class Database:
         conn.close()
         return False
     
+    def get_stats_bundle(self, period: str, user_id: int = 1) -> Dict[str, Any]:
+        """
+        Lấy toàn bộ dữ liệu cho một màn hình thống kê trong một connection
+        Returns: Dict với balance, summary và details (giao dịch hôm nay / theo ngày / theo tuần)
+        """
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            days = _STATS_SUMMARY_DAYS[period]
+            
+            if period == 'daily':
+                details = self._fetch_daily_transactions(cursor, user_id)
+            elif period == 'weekly':
+                details = self._fetch_weekly_summary_by_days(cursor, user_id, days)
+            else:
+                details = self._fetch_monthly_summary_by_weeks(cursor, user_id)
+            
+            return {
+                'balance': self._fetch_user_balance(cursor, user_id),
+                'summary': self._fetch_spending_summary(cursor, user_id, days),
+                'details': details
+            }
+        finally:
+            conn.close()
+    
     def get_recent_transactions(self, user_id: int = 1, limit: int = 10) -> List[Dict[str, Any]]:
         """Lấy các giao dịch gần đây"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -205,9 +282,14 @@ class Database:
     
     def get_spending_summary(self, user_id: int = 1, days: int = 7) -> Dict[str, Any]:
         """Lấy tổng kết chi tiêu trong số ngày gần đây"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        conn = self._connect()
+        try:
+            return self._fetch_spending_summary(conn.cursor(), user_id, days)
+        finally:
+            conn.close()
+    
+    def _fetch_spending_summary(self, cursor: sqlite3.Cursor, user_id: int = 1, days: int = 7) -> Dict[str, Any]:
+        """Lấy tổng kết chi tiêu trong số ngày gần đây - chạy trên cursor có sẵn"""
         date_threshold = (datetime.date.today() - datetime.timedelta(days=days)).isoformat()
         
         cursor.execute("""
@@ -222,7 +304,6 @@ class Database:
         """, (user_id, date_threshold))
         
         result = cursor.fetchone()
-        conn.close()
         
         if result:
             columns = ['transaction_count', 'total_spent', 'avg_spent', 'min_spent', 'max_spent']
@@ -244,7 +325,7 @@ class Database:
         Tìm giao dịch theo tiêu chí
         Returns: List các giao dịch phù hợp (sắp xếp theo thời gian gần nhất)
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         # Xây dựng query động
@@ -289,7 +370,7 @@ class Database:
         Xóa giao dịch theo ID
         Returns: True nếu xóa thành công, False nếu không tìm thấy
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         # Kiểm tra giao dịch tồn tại và thuộc về user
@@ -352,7 +433,7 @@ class Database:
     
     def delete_most_recent_transaction(self, user_id: int = 1) -> Dict[str, Any]:
         """Xóa giao dịch gần nhất"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -418,7 +499,7 @@ class Database:
     
     def get_transaction_with_details(self, transaction_id: int) -> Optional[Dict[str, Any]]:
         """Lấy thông tin chi tiết giao dịch bao gồm transaction_type và account_type"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -449,9 +530,14 @@ class Database:
 
     def get_daily_transactions(self, user_id: int = 1, target_date: Optional[str] = None) -> List[Dict[str, Any]]:
         """Lấy TẤT CẢ giao dịch trong một ngày cụ thể"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        conn = self._connect()
+        try:
+            return self._fetch_daily_transactions(conn.cursor(), user_id, target_date)
+        finally:
+            conn.close()
+    
+    def _fetch_daily_transactions(self, cursor: sqlite3.Cursor, user_id: int = 1, target_date: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Lấy TẤT CẢ giao dịch trong một ngày cụ thể - chạy trên cursor có sẵn"""
         if not target_date:
             target_date = datetime.date.today().isoformat()
         
@@ -464,7 +550,6 @@ class Database:
         """, (user_id, target_date))
         
         rows = cursor.fetchall()
-        conn.close()
         
         transactions = []
         for row in rows:
@@ -484,9 +569,14 @@ class Database:
     
     def get_weekly_summary_by_days(self, user_id: int = 1, days: int = 7) -> List[Dict[str, Any]]:
         """Lấy tổng chi tiêu theo từng ngày trong tuần qua"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        conn = self._connect()
+        try:
+            return self._fetch_weekly_summary_by_days(conn.cursor(), user_id, days)
+        finally:
+            conn.close()
+    
+    def _fetch_weekly_summary_by_days(self, cursor: sqlite3.Cursor, user_id: int = 1, days: int = 7) -> List[Dict[str, Any]]:
+        """Lấy tổng chi tiêu theo từng ngày trong tuần qua - chạy trên cursor có sẵn"""
         # Lấy days ngày gần nhất
         end_date = datetime.date.today()
         start_date = end_date - datetime.timedelta(days=days-1)
@@ -503,7 +593,6 @@ class Database:
         """, (user_id, start_date.isoformat(), end_date.isoformat()))
         
         rows = cursor.fetchall()
-        conn.close()
         
         # Tạo dict để dễ lookup
         data_by_date = {}
@@ -535,9 +624,14 @@ class Database:
     
     def get_monthly_summary_by_weeks(self, user_id: int = 1) -> List[Dict[str, Any]]:
         """Lấy tổng chi tiêu theo từng tuần trong tháng"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        conn = self._connect()
+        try:
+            return self._fetch_monthly_summary_by_weeks(conn.cursor(), user_id)
+        finally:
+            conn.close()
+    
+    def _fetch_monthly_summary_by_weeks(self, cursor: sqlite3.Cursor, user_id: int = 1) -> List[Dict[str, Any]]:
+        """Lấy tổng chi tiêu theo từng tuần trong tháng - chạy trên cursor có sẵn"""
         # Lấy 4 tuần gần nhất (28 ngày)
         end_date = datetime.date.today()
         start_date = end_date - datetime.timedelta(days=27)  # 4 tuần = 28 ngày
@@ -554,7 +648,6 @@ class Database:
         """, (user_id, start_date.isoformat(), end_date.isoformat()))
         
         rows = cursor.fetchall()
-        conn.close()
         
         # Nhóm theo tuần
         weeks = []
@@ -588,7 +681,7 @@ class Database:
     
     def get_monthly_summary_by_days(self, user_id: int = 1, days: int = 30) -> List[Dict[str, Any]]:
         """Lấy tổng chi tiêu theo từng ngày trong tháng (cho biểu đồ)"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         end_date = datetime.date.today()
@@ -638,9 +731,14 @@ class Database:
 
     def get_current_month_summary_by_days(self, user_id: int = 1) -> List[Dict[str, Any]]:
         """Lấy tổng chi tiêu theo từng ngày trong THÁNG HIỆN TẠI (từ ngày 1 đến cuối tháng)"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        conn = self._connect()
+        try:
+            return self._fetch_current_month_summary_by_days(conn.cursor(), user_id)
+        finally:
+            conn.close()
+    
+    def _fetch_current_month_summary_by_days(self, cursor: sqlite3.Cursor, user_id: int = 1) -> List[Dict[str, Any]]:
+        """Lấy tổng chi tiêu theo từng ngày trong THÁNG HIỆN TẠI (từ ngày 1 đến cuối tháng) - chạy trên cursor có sẵn"""
         # Lấy ngày đầu và cuối tháng hiện tại
         today = datetime.date.today()
         start_date = today.replace(day=1)  # Ngày 1 của tháng hiện tại
@@ -664,7 +762,6 @@ class Database:
         """, (user_id, start_date.isoformat(), end_date.isoformat()))
         
         rows = cursor.fetchall()
-        conn.close()
         
         # Tạo dict để dễ lookup
         data_by_date = {}
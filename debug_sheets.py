@@ -93,8 +93,8 @@ def main():
                 existing = gc.open(test_name)
                 gc.del_spreadsheet_by_key(existing.id)
                 console.print("🗑️ Deleted existing test spreadsheet")
-            except:
-                pass
+            except gspread.exceptions.SpreadsheetNotFound:
+                pass  # Chưa có - tạo mới bên dưới
             
             # Create new minimal sheet
             new_sheet = gc.create(test_name)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Expense Tracker Daemon - giữ một ExpenseTracker sống lâu cho các lệnh CLI nhanh
+Usage:
+  python main.py --daemon                 # Chạy daemon (Ctrl+C để dừng)
+  python main.py -a "trưa ăn phở 30k"     # Tự gửi qua daemon nếu đang chạy
+
+Giao thức: mỗi kết nối gửi một dòng JSON {"op": "message", "text": "..."},
+nhận lại một dòng JSON là kết quả của ExpenseTracker.process_user_message.
+{"op": "ping"} trả về trạng thái LLM (llm_available, llm_retry_in): sau lỗi/timeout LLM
+daemon dùng rule-based và tự thử lại LLM sau llm_processor._LLM_RETRY_COOLDOWN giây.
+"""
+
+import os
+import json
+import socket
+from typing import Optional, Dict, Any
+
+SOCKET_PATH = os.path.expanduser("~/.expense_assistant.sock")
+# Daemon có thể phải gọi LLM nên client chờ lâu hơn một lượt LLM
+CLIENT_TIMEOUT = 60
+# Daemon xử lý tuần tự - client kết nối mà không gửi hết dòng yêu cầu thì bỏ sau chừng này giây
+REQUEST_READ_TIMEOUT = 5
+
+DAEMON_AVAILABLE = hasattr(socket, "AF_UNIX")
+
+
+def _read_line(conn: socket.socket) -> bytes:
+    """Đọc tới hết dòng đầu tiên (hoặc tới khi bên kia đóng)"""
+    chunks = []
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        if b"\n" in chunk:
+            break
+    return b"".join(chunks).split(b"\n", 1)[0]
+
+
+def _request(payload: Dict[str, Any], timeout: float = CLIENT_TIMEOUT) -> Optional[Dict[str, Any]]:
+    """Gửi một yêu cầu tới daemon
+    
+    Trả về None chỉ khi không kết nối được (daemon không chạy) - caller có thể tự xử lý.
+    Đã gửi yêu cầu rồi mà lỗi/timeout thì trả về kết quả lỗi: daemon có thể vẫn đang
+    xử lý, chạy lại trong process sẽ ghi/xóa giao dịch hai lần.
+    """
+    if not DAEMON_AVAILABLE or not os.path.exists(SOCKET_PATH):
+        return None
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(timeout)
+        try:
+            conn.connect(SOCKET_PATH)
+        except OSError:
+            # Socket cũ còn sót lại, daemon đã tắt, không có quyền hoặc connect timeout -
+            # chưa gửi gì nên chạy trực tiếp trong process
+            return None
+
+        try:
+            conn.sendall(json.dumps(payload).encode() + b"\n")
+            response = _read_line(conn)
+        except OSError as e:
+            return {"success": False, "message": f"Daemon không phản hồi ({e or 'timeout'}) - yêu cầu có thể đã được xử lý, kiểm tra lại trước khi thử lại"}
+
+    try:
+        return json.loads(response)
+    except ValueError:
+        return {"success": False, "message": "Daemon trả về kết quả không hợp lệ - yêu cầu có thể đã được xử lý"}
+
+
+def send_message(text: str) -> Optional[Dict[str, Any]]:
+    """Xử lý tin nhắn qua daemon, None nếu không kết nối được daemon"""
+    return _request({"op": "message", "text": text})
+
+
+def _handle(tracker, request: Dict[str, Any]) -> Dict[str, Any]:
+    if request.get("op") == "ping":
+        # Báo luôn trạng thái LLM: lỗi LLM chuyển daemon sang rule-based tới hết cooldown
+        from llm_processor import llm_status
+        return {"success": True, **llm_status()}
+    if request.get("op") != "message" or not isinstance(request.get("text"), str):
+        return {"success": False, "message": "Yêu cầu không hợp lệ"}
+    return tracker.process_user_message(request["text"])
+
+
+def serve(tracker):
+    """Chạy daemon trên SOCKET_PATH, xử lý tuần tự từng yêu cầu"""
+    if not DAEMON_AVAILABLE:
+        print("❌ Hệ điều hành không hỗ trợ Unix socket")
+        return
+
+    if os.path.exists(SOCKET_PATH):
+        if _request({"op": "ping"}, timeout=2) is not None:
+            print(f"⚠️ Daemon đã chạy tại {SOCKET_PATH}")
+            return
+        os.unlink(SOCKET_PATH)  # Socket cũ từ lần chạy trước
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Chỉ user hiện tại được kết nối
+    old_umask = os.umask(0o177)
+    try:
+        server.bind(SOCKET_PATH)
+    finally:
+        os.umask(old_umask)
+    server.listen()
+    print(f"🚀 Expense daemon đang chạy tại {SOCKET_PATH} (Ctrl+C để dừng)")
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                conn.settimeout(REQUEST_READ_TIMEOUT)
+                try:
+                    request = json.loads(_read_line(conn))
+                    result = _handle(tracker, request)
+                except socket.timeout:
+                    result = {"success": False, "message": "Hết thời gian chờ yêu cầu"}
+                except Exception as e:
+                    result = {"success": False, "message": f"Lỗi daemon: {e}"}
+                try:
+                    conn.sendall(json.dumps(result, default=str).encode() + b"\n")
+                except OSError:
+                    pass  # Client đã ngắt kết nối
+    except KeyboardInterrupt:
+        print("\n👋 Đã dừng daemon")
+    finally:
+        server.close()
+        if os.path.exists(SOCKET_PATH):
+            os.unlink(SOCKET_PATH)
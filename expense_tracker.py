@@ -1,16 +1,21 @@
 from typing import Dict, List, Any, Optional
 from database import Database
-from llm_processor import ExpenseExtractor, QueryAnalyzer
+from llm_processor import ExpenseExtractor, split_expense_message
 from google_sheets_sync import get_sheets_sync
 import datetime
 
+# Các tin nhắn được hiểu là "xóa giao dịch gần nhất"
+_DELETE_RECENT_MESSAGES = frozenset({
+    '', 'xóa', 'gần nhất', 'recent', 'last', 'latest',
+    'xóa giao dịch gần nhất', 'xóa gần nhất',
+})
+
 
 class ExpenseTracker:
     def __init__(self, db_path: str = "expense_tracker.db"):
         """Khởi tạo expense tracker"""
         self.db = Database(db_path)
         self.llm_processor = ExpenseExtractor()
-        self.query_analyzer = QueryAnalyzer()
         self.sheets_sync = get_sheets_sync()
         self.current_user_id = 1  # Mặc định user đầu tiên
         
@@ -24,13 +29,19 @@ class ExpenseTracker:
         Returns: Dict chứa kết quả xử lý và thông tin phản hồi
         """
         
-        # Kiểm tra intent trước
-        intent_result = self.query_analyzer.analyze_intent(message)
+        # Phân tích intent và trích xuất chi tiêu trong cùng một lượt gọi LLM
+        # để add_expense chỉ tốn một round-trip thay vì hai
+        intent_result, expense_info = self.llm_processor.classify_and_extract(message)
         intent = intent_result.get('intent', 'unknown')
         
         # Xử lý theo intent
         if intent == 'add_expense':
-            result = self._handle_expense_entry(message)
+            # Nhiều giao dịch trong một tin nhắn - trích xuất từng phần song song
+            parts = split_expense_message(message)
+            if len(parts) > 1:
+                result = self._handle_expense_entries(parts)
+            else:
+                result = self._handle_expense_entry(message, expense_info)
         elif intent == 'delete_expense':
             result = self._handle_expense_deletion(message)
         elif intent == 'update_balance':
@@ -53,7 +64,7 @@ class ExpenseTracker:
             result = self._handle_statistics_request(message)
         else:
             # Fallback: thử extract expense info
-            result = self._handle_expense_entry(message)
+            result = self._handle_expense_entry(message, expense_info)
         
         # Thêm thông tin offline mode vào result
         if result and intent_result.get('offline_mode', False):
@@ -63,11 +74,12 @@ class ExpenseTracker:
         
         return result
     
-    def _handle_expense_entry(self, message: str) -> Dict[str, Any]:
+    def _handle_expense_entry(self, message: str, expense_info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Xử lý việc thêm chi tiêu"""
         try:
-            # Trích xuất thông tin từ LLM
-            expense_info = self.llm_processor.extract_expense_info(message)
+            # Trích xuất thông tin từ LLM (dùng kết quả của lượt gọi kết hợp nếu có)
+            if expense_info is None:
+                expense_info = self.llm_processor.extract_expense_info(message)
             
             # Điều chỉnh threshold dựa trên chế độ offline
             min_confidence = 0.25 if expense_info.get('offline_mode', False) else 0.4
@@ -149,6 +161,28 @@ class ExpenseTracker:
                 'error': str(e)
             }
     
+    def _handle_expense_entries(self, parts: List[str]) -> Dict[str, Any]:
+        """Thêm lần lượt các giao dịch của tin nhắn nhiều giao dịch, gộp kết quả thành một"""
+        expense_infos = self.llm_processor.extract_expense_infos(parts)
+        results = [self._handle_expense_entry(part, expense_info)
+                   for part, expense_info in zip(parts, expense_infos)]
+        
+        lines = [result['message'] if result['success'] else f"❌ {part}: {result['message']}"
+                 for part, result in zip(parts, results)]
+        succeeded = [result for result in results if result['success']]
+        if not succeeded:
+            return {**results[0], 'message': "\n".join(lines)}
+        
+        # Thống kê của giao dịch cuối đã tính tất cả giao dịch vừa thêm
+        combined = dict(succeeded[-1])
+        combined['message'] = "\n".join(lines)
+        combined['transaction_ids'] = [result['transaction_id'] for result in succeeded]
+        combined['statistics'] = {
+            **combined['statistics'],
+            'this_transaction': sum(result['expense_info']['price'] for result in succeeded)
+        }
+        return combined
+    
     def _auto_update_balance(self, transaction_info: Dict[str, Any]) -> bool:
         """Tự động cập nhật số dư dựa trên giao dịch"""
         try:
@@ -286,14 +320,8 @@ class ExpenseTracker:
             # Kiểm tra các trường hợp đặc biệt để xóa giao dịch gần nhất
             message_clean = message.strip().lower()
             
-            # Các từ khóa để xóa giao dịch gần nhất
-            recent_keywords = ['xóa', 'gần nhất', 'recent', 'last', 'latest', '']
-            
             # Nếu chỉ là từ khóa đơn giản, xóa giao dịch gần nhất
-            if (message_clean in recent_keywords or 
-                message_clean == 'xóa giao dịch gần nhất' or
-                message_clean == 'xóa gần nhất' or
-                len(message_clean) == 0):
+            if message_clean in _DELETE_RECENT_MESSAGES:
                 
                 # Xóa giao dịch gần nhất
                 delete_result = self.db.delete_most_recent_transaction(self.current_user_id)
@@ -10,7 +10,7 @@ load_dotenv()
 try:
     import gspread
     from google.oauth2.service_account import Credentials
-    from gspread.exceptions import APIError, SpreadsheetNotFound
+    from gspread.exceptions import APIError, SpreadsheetNotFound, WorksheetNotFound
     GSPREAD_AVAILABLE = True
 except ImportError:
     GSPREAD_AVAILABLE = False
@@ -122,7 +122,7 @@ class GoogleSheetsSync:
             # Worksheet cho transactions
             try:
                 transactions_ws = self.spreadsheet.worksheet("Transactions")
-            except:
+            except WorksheetNotFound:
                 transactions_ws = self.spreadsheet.add_worksheet(
                     title="Transactions", 
                     rows=1000, 
@@ -145,7 +145,7 @@ class GoogleSheetsSync:
             # Worksheet cho user balance
             try:
                 balance_ws = self.spreadsheet.worksheet("Balance")
-            except:
+            except WorksheetNotFound:
                 balance_ws = self.spreadsheet.add_worksheet(
                     title="Balance",
                     rows=100,
@@ -164,7 +164,7 @@ class GoogleSheetsSync:
             # Worksheet cho statistics summary
             try:
                 stats_ws = self.spreadsheet.worksheet("Statistics")
-            except:
+            except WorksheetNotFound:
                 stats_ws = self.spreadsheet.add_worksheet(
                     title="Statistics",
                     rows=500,
@@ -186,7 +186,7 @@ class GoogleSheetsSync:
             # Worksheet cho daily summary (bonus)
             try:
                 daily_ws = self.spreadsheet.worksheet("Daily Summary")
-            except:
+            except WorksheetNotFound:
                 daily_ws = self.spreadsheet.add_worksheet(
                     title="Daily Summary",
                     rows=366,  # Một năm
@@ -6,14 +6,28 @@ Handles LLM-based parsing with Pydantic schemas
 
 import os
 import re
+import threading
+import time
 import datetime
+import importlib.util
 import logging
-from typing import Dict, Optional, Any, List
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Optional, Any, List, Literal, NamedTuple, Tuple
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
-from langchain.output_parsers import PydanticOutputParser
+from langchain.output_parsers import PydanticOutputParser, OutputFixingParser
 from langchain.prompts import PromptTemplate
-from config import get_current_model, get_model_settings
+from config import get_current_model, get_model_settings, get_fallback_model
+
+# Provider SDK nặng (google-genai, ollama client) chỉ import khi thực sự tạo LLM;
+# ở đây chỉ kiểm tra đã cài đặt hay chưa
+GOOGLE_GENAI_AVAILABLE = importlib.util.find_spec("langchain_google_genai") is not None
+OLLAMA_AVAILABLE = importlib.util.find_spec("langchain_ollama") is not None
+
+logger = logging.getLogger(__name__)
 
 # Suppress verbose langchain retry logs
 logging.getLogger("langchain_google_genai").setLevel(logging.ERROR)
@@ -26,28 +40,313 @@ load_dotenv()
 # Global flag để track trạng thái kết nối
 _llm_available = True
 _offline_warning_shown = False
+# Lỗi LLM chuyển sang rule-based; sau cooldown thì thử lại LLM.
+# Một lần chạy CLI ngắn không bao giờ chạm tới cooldown - chủ yếu cho daemon chạy lâu
+_LLM_RETRY_COOLDOWN = 300.0  # giây
+_llm_offline_since: Optional[float] = None
+
+# Precompiled regex patterns cho rule-based parsing
+# Giá tiền: 35k, 35.5k, 35 nghìn/ngàn, 5 triệu, 1.5tr, 35000
+_PRICE_RE = re.compile(
+    r'(?P<k>\d+(?:\.\d+)?)k\b|(?P<nghin>\d+)\s*(?:nghìn|ngàn)\b'
+    r'|(?P<trieu>\d+(?:\.\d+)?)\s*(?:triệu|tr)\b|(?P<raw>\d+000)\b'
+)
+_AMOUNT_TOKEN_RE = re.compile(r'\d+k?')
+# Số ngày thống kê: "5 ngày", "30 ngày qua"
+_DAY_RE = re.compile(r'(\d+)\s*ngày')
+_PERIOD_DAYS = {'daily': 1, 'weekly': 7, 'monthly': 30}
+# Ranh giới giữa các giao dịch trong một tin nhắn: ';' hoặc ',' + khoảng trắng (giữ nguyên "1,5tr")
+_EXPENSE_SPLIT_RE = re.compile(r';|,\s+')
+# Số lượt trích xuất chạy song song cho tin nhắn nhiều giao dịch
+_EXTRACT_MAX_WORKERS = 4
+
+# Khối JSON đầu tiên trong response (cho phép một cấp lồng nhau)
+_JSON_BLOCK_RE = re.compile(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', re.S)
+
+# Keyword tables cho các hàm rule-based (tag -> keywords)
+_MEAL_TIMES = ('sáng', 'trưa', 'chiều', 'tối')
+# Từ đồng nghĩa tiếng Anh -> bữa ăn chuẩn
+_MEAL_ALIASES = {'sáng': ('breakfast',), 'trưa': ('lunch',), 'chiều': (), 'tối': ('dinner',)}
+_MESSAGE_KEYWORDS = {
+    # Intent
+    'delete': ('xóa', 'xoá', 'hủy', 'delete'),
+    'statistics': ('thống kê', 'statistic', 'báo cáo', 'tổng kết'),
+    'balance': ('số dư', 'balance', 'tài khoản', 'set'),
+    'expense': ('ăn', 'uống', 'mua', 'chi tiêu', 'trả tiền'),
+    # Expense extraction
+    'income': ('lương', 'thưởng', 'nhận', 'được cho', 'được trả', 'thu nhập'),
+    'transfer': ('ck', 'chuyển khoản'),
+    'account': ('tài khoản', 'ngân hàng', 'account', 'atm', 'banking', 'vào tài khoản', 'bank'),
+    'cash': ('tiền mặt', 'cash', 'tiền lẻ', 'tiền túi'),
+    **{meal_time: (meal_time,) + _MEAL_ALIASES[meal_time] for meal_time in _MEAL_TIMES},
+    # Balance / delete / statistics
+    'set_op': ('set', 'đặt lại', 'cập nhật lại', 'thiết lập', 'reset', 'chỉ có', 'chỉ còn'),
+    'recent': ('gần nhất', 'recent', 'cuối'),
+    'today': ('hôm nay', 'today'),
+    'week': ('tuần', 'week'),
+    'month': ('tháng', 'month'),
+}
+
+
+def _build_keyword_scanner(keyword_table: Dict[str, tuple]):
+    """
+    Gộp tất cả keyword thành một regex alternation duy nhất.
+    Dùng lookahead để các keyword chồng lên nhau (vd: 'vào tài khoản' và 'tài khoản') đều được ghi nhận;
+    keyword thuộc nhiều tag (vd: 'tài khoản') trả về tất cả các tag đó.
+    """
+    keyword_tags = {}
+    for tag, keywords in keyword_table.items():
+        for keyword in keywords:
+            keyword_tags.setdefault(keyword, set()).add(tag)
+    
+    groups = {}
+    alternatives = []
+    for i, keyword in enumerate(sorted(keyword_tags, key=len, reverse=True)):
+        group_name = f"g{i}"
+        groups[group_name] = frozenset(keyword_tags[keyword])
+        alternatives.append(f"(?P<{group_name}>{re.escape(keyword)})")
+    return re.compile(f"(?=(?:{'|'.join(alternatives)}))"), groups
+
+
+def _scan_keywords(scanner, message_lower: str) -> set:
+    """Quét message một lần, trả về tập các tag có keyword xuất hiện"""
+    pattern, groups = scanner
+    hits = set()
+    for match in pattern.finditer(message_lower):
+        hits |= groups[match.lastgroup]
+    return hits
+
+
+_MESSAGE_SCANNER = _build_keyword_scanner(_MESSAGE_KEYWORDS)
+
+# Cache kết quả LLM theo message đã chuẩn hóa - tránh gọi lại LLM cho câu chat lặp lại
+_RESPONSE_CACHE_SIZE = 1024
+_response_cache = OrderedDict()
+# Model đang dùng (model, fallback model) - là một phần của cache key để đổi model không trả kết quả cũ
+_cache_model_key = None
+# Extraction chạy trong worker thread song song với intent analysis
+_response_cache_lock = threading.Lock()
+
+
+# Các từ không phải mô tả món/giao dịch
+_FOOD_SKIP_WORDS = frozenset(('sáng', 'trưa', 'chiều', 'tối', 'ăn', 'uống', 'mua', 'ck', 'bank', 'cash',
+                              'nghìn', 'ngàn', 'triệu', 'tr', 'breakfast', 'lunch', 'dinner'))
+
+# Ngưỡng confidence của rule-based để bỏ qua LLM
+_RULE_INTENT_CONFIDENCE = 0.8
+_RULE_EXTRACTION_CONFIDENCE = 0.6
+
+# Tag của các intent khác add_expense - xuất hiện nhiều hơn một thì câu bị mơ hồ
+_INTENT_TAGS = frozenset(('delete', 'statistics', 'balance'))
+_BALANCE_TAGS = frozenset(('balance', 'account', 'cash', 'set_op'))
+
+def _extract_json_block(response) -> str:
+    """Cắt khối JSON ra khỏi response (bỏ ```json fence hoặc câu dẫn của model)"""
+    text = response.content if hasattr(response, 'content') else response
+    if not isinstance(text, str):
+        text = str(text)
+    
+    # Fast path: response đã là JSON thuần
+    stripped = text.strip()
+    if stripped.startswith('{') and stripped.endswith('}'):
+        return stripped
+    
+    match = _JSON_BLOCK_RE.search(text)
+    return match.group(0) if match else text
+
+def _match_amount(match) -> float:
+    """Số tiền (VND) của một match _PRICE_RE"""
+    if match.lastgroup == 'raw':
+        return float(match.group('raw'))
+    if match.lastgroup == 'trieu':
+        return float(match.group('trieu')) * 1000000
+    # "k" / "nghìn" luôn nhân 1000
+    return float(match.group(match.lastgroup)) * 1000
+
+def _stream_until_json(chain, inputs: Dict[str, Any]) -> str:
+    """Stream response của chain, dừng ngay khi object JSON đầu tiên đóng ngoặc"""
+    parts = []
+    depth = 0
+    in_string = escaped = False
+    for chunk in chain.stream(inputs):
+        text = chunk.content if isinstance(chunk.content, str) else str(chunk.content)
+        parts.append(text)
+        # Chỉ quét phần text mới, theo dõi ngoặc nhọn ngoài string literal
+        for char in text:
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '{':
+                depth += 1
+            elif depth and char == '"':
+                in_string = True
+            elif depth and char == '}':
+                depth -= 1
+                if depth == 0:
+                    return "".join(parts)
+    return "".join(parts)
+
+def _parse_price(message_lower: str) -> float:
+    """Giá tiền đầu tiên trong message (VND), 0.0 nếu không tìm thấy"""
+    match = _PRICE_RE.search(message_lower)
+    return _match_amount(match) if match else 0.0
+
+class _MessageScan(NamedTuple):
+    """Kết quả quét message một lần, dùng chung cho các hàm rule-based"""
+    message_lower: str
+    hits: frozenset
+    price: float
+    meal_time: Optional[str]
+    food_words: tuple       # Từ mô tả món/giao dịch (> 2 ký tự), theo thứ tự xuất hiện
+    descriptive_count: int  # Số từ còn lại sau khi bỏ giá tiền và từ thời gian/action
+
+@lru_cache(maxsize=256)
+def _scan_message(message: str) -> _MessageScan:
+    """Quét keyword, giá tiền, bữa ăn và từ mô tả của message (cache theo message)"""
+    # Lowercase một lần cho mọi hàm rule-based dùng chung
+    message_lower = message.lower()
+    hits = frozenset(_scan_keywords(_MESSAGE_SCANNER, message_lower))
+    meal_time = next((m for m in _MEAL_TIMES if m in hits), None)
+    
+    words = []
+    for word in message_lower.split():
+        # Từ chỉ gồm chữ cái (trường hợp phổ biến) không cần bỏ số/dấu câu
+        word_clean = word if word.isalpha() else _AMOUNT_TOKEN_RE.sub('', word).strip('.,!?')
+        if word_clean and word_clean not in _FOOD_SKIP_WORDS:
+            words.append(word_clean)
+    food_words = tuple(word for word in words if len(word) > 2)
+    
+    return _MessageScan(message_lower, hits, _parse_price(message_lower), meal_time, food_words, len(words))
+
+def split_expense_message(message: str) -> List[str]:
+    """
+    Tách tin nhắn nhiều giao dịch ("sáng phở 30k, trưa cơm 50k") thành từng phần.
+    Chỉ tách khi mọi phần đều có giá tiền, ngược lại trả về [message]
+    """
+    parts = [part.strip() for part in _EXPENSE_SPLIT_RE.split(message) if part.strip()]
+    if len(parts) > 1 and all(_scan_message(part).price > 0 for part in parts):
+        return parts
+    return [message]
+
+def _is_unambiguous_balance(scan: _MessageScan) -> bool:
+    """SET số dư rõ ràng: có từ khóa set, có số tiền và chỉ một loại tài khoản"""
+    return ('set_op' in scan.hits and scan.price > 0
+            and ('account' in scan.hits) != ('cash' in scan.hits))
+
+def _has_balance_signal(scan: _MessageScan) -> bool:
+    """Có từ khóa liên quan số dư/tài khoản - không có thì chắc chắn không phải cập nhật số dư"""
+    return bool(scan.hits & _BALANCE_TAGS)
+
+def _is_unambiguous_statistics(scan: _MessageScan) -> bool:
+    """Yêu cầu thống kê có khoảng thời gian rõ ràng (hôm nay/tuần/tháng/N ngày)"""
+    return bool(scan.hits & {'today', 'week', 'month'}) or _DAY_RE.search(scan.message_lower) is not None
+
+# Timeout/retry cho mỗi lượt gọi LLM - do client tự hủy request,
+# không cần signal handler (an toàn khi chạy trong thread)
+_LLM_REQUEST_TIMEOUT = 10
+_LLM_MAX_RETRIES = 1
+# Giữ model Ollama trong bộ nhớ giữa các tin nhắn (mặc định Ollama unload sau 5 phút)
+_OLLAMA_KEEP_ALIVE = "30m"
+# Output JSON dài nhất (intent + expense) ~80 tokens - giới hạn để model không sinh thêm text thừa
+_LLM_MAX_OUTPUT_TOKENS = 160
+
+# Kết quả probe kết nối (url -> (thời điểm, ok)) được dùng lại trong _PROBE_TTL giây
+_PROBE_TTL = 30.0
+_probe_results = {}
+_probe_lock = threading.Lock()
+# Session giữ keep-alive connection cho các lần probe/preload tới cùng host
+_probe_session = requests.Session()
+
+def _probe_url(url: str, timeout: float) -> bool:
+    """Kiểm tra url phản hồi OK, dùng chung kết quả cho mọi instance trong _PROBE_TTL giây"""
+    with _probe_lock:
+        now = time.monotonic()
+        cached = _probe_results.get(url)
+        if cached and now - cached[0] < _PROBE_TTL:
+            return cached[1]
+        
+        # Probe trong lock để các thread khởi tạo cùng lúc không probe trùng
+        try:
+            ok = _probe_session.get(url, timeout=timeout).ok
+        except Exception:
+            ok = False
+        
+        _probe_results[url] = (now, ok)
+        return ok
+
+def _normalize_message(message: str) -> str:
+    """
+    Chuẩn hóa message làm cache key: lowercase, bỏ khoảng trắng thừa,
+    quy số tiền về VND để các cách viết tương đương ("35k", "35 nghìn", "35000") dùng chung cache
+    """
+    normalized = " ".join(message.lower().split())
+    return _PRICE_RE.sub(lambda match: f"{_match_amount(match):.0f}đ", normalized)
+
+
+def _template_message(message: str) -> Optional[str]:
+    """
+    Template của message: thay số tiền bằng placeholder để "ăn phở 30k" và "ăn phở 35k" dùng chung cache.
+    Chỉ áp dụng khi message có đúng một số tiền, ngược lại trả về None
+    """
+    normalized = " ".join(message.lower().split())
+    templated, count = _PRICE_RE.subn('<giá>', normalized)
+    return templated if count == 1 else None
+
+
+def _cache_key(method: str, message: str, template: bool) -> tuple:
+    if template:
+        templated = _template_message(message)
+        if templated is not None:
+            return (method, _cache_model_key, templated)
+    return (method, _cache_model_key, _normalize_message(message))
+
+
+def _get_cached_response(method: str, message: str, template: bool = False) -> Optional[Dict[str, Any]]:
+    """Lấy kết quả LLM đã cache (trả về bản copy để tránh bị sửa đổi)"""
+    key = _cache_key(method, message, template)
+    with _response_cache_lock:
+        cached = _response_cache.get(key)
+        if cached is None:
+            return None
+        _response_cache.move_to_end(key)
+    return dict(cached)
+
+
+def _cache_response(method: str, message: str, result: Dict[str, Any], template: bool = False):
+    """Lưu kết quả LLM vào cache, loại bỏ entry cũ nhất khi đầy"""
+    key = _cache_key(method, message, template)
+    with _response_cache_lock:
+        _response_cache[key] = dict(result)
+        if len(_response_cache) > _RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
 
 
 # Pydantic Models for LLM Response Schemas
-class IntentAnalysis(BaseModel):
-    """Schema for intent analysis results"""
-    intent: str = Field(description="Intent category: add_expense, delete_expense, update_balance, view_statistics, unknown")
-    confidence: float = Field(description="Confidence level (0.0-1.0)", ge=0.0, le=1.0)
-    analysis: str = Field(description="Brief analysis of the user's intent")
+IntentType = Literal["add_expense", "delete_expense", "update_balance", "view_statistics", "unknown"]
 
 class ExpenseInfo(BaseModel):
     """Schema for expense extraction results"""
     food_item: str = Field(description="Name of food/drink or transaction description")
     price: float = Field(description="Price amount as number")
     meal_time: Optional[str] = Field(default=None, description="Meal time: sáng, trưa, chiều, tối, or specific time")
-    transaction_type: str = Field(default="expense", description="Transaction type: expense or income")
-    account_type: str = Field(default="cash", description="Account type: cash or account")
+    transaction_type: Literal["expense", "income"] = Field(default="expense", description="Transaction type: expense or income")
+    account_type: Literal["cash", "account"] = Field(default="cash", description="Account type: cash or account")
+    confidence: float = Field(description="Confidence level (0.0-1.0)", ge=0.0, le=1.0)
+
+class IntentExpenseInfo(BaseModel):
+    """Schema for combined intent analysis + expense extraction (một lượt gọi LLM)"""
+    intent: IntentType = Field(description="Intent category: add_expense, delete_expense, update_balance, view_statistics, unknown")
     confidence: float = Field(description="Confidence level (0.0-1.0)", ge=0.0, le=1.0)
+    expense: Optional[ExpenseInfo] = Field(default=None, description="Expense details, only when intent is add_expense")
 
 class BalanceUpdate(BaseModel):
     """Schema for balance update analysis"""
     is_balance_update: bool = Field(description="Whether this is a balance update request")
-    operation_type: str = Field(description="Operation type: set or add")
+    operation_type: Literal["set", "add"] = Field(description="Operation type: set or add")
     cash_balance: Optional[float] = Field(default=None, description="Cash balance to set (for SET operations)")
     account_balance: Optional[float] = Field(default=None, description="Account balance to set (for SET operations)")
     cash_amount: Optional[float] = Field(default=None, description="Cash amount to add/subtract (for ADD operations)")
@@ -64,17 +363,147 @@ class DeleteInfo(BaseModel):
 
 class StatisticsInfo(BaseModel):
     """Schema for statistics request analysis"""
-    period: str = Field(description="Statistics period: daily, weekly, monthly")
+    period: Literal["daily", "weekly", "monthly"] = Field(description="Statistics period: daily, weekly, monthly")
     specific_date: Optional[str] = Field(default=None, description="Specific date if requested")
     confidence: float = Field(description="Confidence level (0.0-1.0)", ge=0.0, le=1.0)
 
+# System prompts - hằng số module, không dựng lại string mỗi lần gọi
+_EXPENSE_SYSTEM_PROMPT = """Trích xuất giao dịch từ câu chat tiếng Việt.
+transaction_type: income (lương, nhận tiền, thưởng) | expense (ăn, uống, mua, trả tiền).
+account_type: account (ck, chuyển khoản, tài khoản, ngân hàng, bank, atm) | cash (tiền mặt, mặc định).
+price: "35k" = 35000; không có "k" thì giữ nguyên số.
+Chỉ trả về JSON: {{"food_item": "...", "price": 0, "meal_time": "sáng|trưa|chiều|tối" hoặc null, "transaction_type": "...", "account_type": "...", "confidence": 0.0-1.0}}"""
+
+_INTENT_EXPENSE_SYSTEM_PROMPT = """Phân loại intent câu chat tiếng Việt, nếu là add_expense thì trích xuất luôn giao dịch:
+intent: add_expense (ăn, uống, mua, trả tiền, lương, nhận tiền) | delete_expense (xóa, hủy) | update_balance (số dư, set balance) | view_statistics (thống kê, báo cáo) | unknown.
+transaction_type: income (lương, nhận tiền, thưởng) | expense (ăn, uống, mua, trả tiền).
+account_type: account (ck, chuyển khoản, tài khoản, ngân hàng, bank, atm) | cash (tiền mặt, mặc định).
+price: "35k" = 35000; không có "k" thì giữ nguyên số.
+Chỉ trả về JSON: {{"intent": "...", "confidence": 0.0-1.0, "expense": {{"food_item": "...", "price": 0, "meal_time": "sáng|trưa|chiều|tối" hoặc null, "transaction_type": "...", "account_type": "...", "confidence": 0.0-1.0}} hoặc null nếu không phải add_expense}}"""
+
+_DELETE_SYSTEM_PROMPT = """Trích xuất giao dịch cần xóa từ câu chat tiếng Việt.
+delete_recent: true nếu xóa giao dịch gần nhất ("gần nhất", "recent", hoặc không nêu món/giá/bữa).
+Nếu xóa cụ thể: food_item (tên món), price ("35k" = 35000), meal_time (sáng|trưa|chiều|tối).
+Chỉ trả về JSON: {{"food_item": "..." hoặc null, "price": 0 hoặc null, "meal_time": "..." hoặc null, "delete_recent": true|false, "confidence": 0.0-1.0}}"""
+
+_BALANCE_SYSTEM_PROMPT = """Trích xuất yêu cầu cập nhật số dư từ câu chat tiếng Việt.
+operation_type: set (đặt số dư cụ thể, dùng cash_balance/account_balance) | add (cộng/trừ, dùng cash_amount/account_amount, trừ thì số âm).
+Chỉ trả về JSON: {{"is_balance_update": true, "operation_type": "set|add", "cash_balance": null, "account_balance": null, "cash_amount": null, "account_amount": null, "description": "ngắn"}}"""
+
+_STATISTICS_SYSTEM_PROMPT = """Trích xuất yêu cầu thống kê chi tiêu từ câu chat tiếng Việt.
+Chỉ trả về JSON: {{"period": "daily|weekly|monthly", "specific_date": "YYYY-MM-DD" hoặc null, "confidence": 0.0-1.0}}"""
+
+# Parser và prompt template không đổi giữa các lần gọi - tạo một lần khi import.
+# System prompt cố định đứng đầu để provider tái sử dụng prefix cache
+_EXPENSE_PARSER = PydanticOutputParser(pydantic_object=ExpenseInfo)
+_INTENT_EXPENSE_PARSER = PydanticOutputParser(pydantic_object=IntentExpenseInfo)
+_DELETE_PARSER = PydanticOutputParser(pydantic_object=DeleteInfo)
+_BALANCE_PARSER = PydanticOutputParser(pydantic_object=BalanceUpdate)
+_STATISTICS_PARSER = PydanticOutputParser(pydantic_object=StatisticsInfo)
+
+_EXPENSE_PROMPT = PromptTemplate(
+    template=_EXPENSE_SYSTEM_PROMPT + "\n\nCâu chat: '{user_message}'\n\nTrích xuất:",
+    input_variables=["user_message"]
+)
+_INTENT_EXPENSE_PROMPT = PromptTemplate(
+    template=_INTENT_EXPENSE_SYSTEM_PROMPT + "\n\nCâu chat: '{user_message}'\n\nPhân tích:",
+    input_variables=["user_message"]
+)
+_DELETE_PROMPT = PromptTemplate(
+    template=_DELETE_SYSTEM_PROMPT + "\n\nCâu chat: '{user_message}'\n\nPhân tích:",
+    input_variables=["user_message"]
+)
+_BALANCE_PROMPT = PromptTemplate(
+    template=_BALANCE_SYSTEM_PROMPT + "\n\nCâu chat: '{user_message}'\n\nPhân tích:",
+    input_variables=["user_message"]
+)
+_STATISTICS_PROMPT = PromptTemplate(
+    template=_STATISTICS_SYSTEM_PROMPT + "\n\nCâu chat: '{user_message}'\n\nPhân tích:",
+    input_variables=["user_message"]
+)
+
+# Chain prompt | LLM và OutputFixingParser gắn với instance LLM - dựng một lần cho mỗi cặp.
+# Value giữ reference tới LLM nên id(llm) trong key không bị tái sử dụng
+_llm_chains = {}
+_fixing_parsers = {}
+
+def _get_chain(prompt: PromptTemplate, llm):
+    """Chain prompt | llm (cache theo cặp prompt, llm)"""
+    key = (id(prompt), id(llm))
+    chain = _llm_chains.get(key)
+    if chain is None:
+        chain = _llm_chains[key] = prompt | llm
+    return chain
+
+def _get_fixing_parser(parser: PydanticOutputParser, llm) -> OutputFixingParser:
+    """OutputFixingParser - chỉ khi JSON sai mới gọi thêm một lượt LLM để sửa (cache theo cặp parser, llm)"""
+    key = (id(parser), id(llm))
+    fixing_parser = _fixing_parsers.get(key)
+    if fixing_parser is None:
+        fixing_parser = _fixing_parsers[key] = OutputFixingParser.from_llm(parser=parser, llm=llm)
+    return fixing_parser
+
+# Instance LLM dùng chung theo cấu hình (model, fallback model) - một connection pool cho mọi processor
+_shared_llms = {}
+_shared_llms_lock = threading.Lock()
+
+def get_shared_llm_instance():
+    """
+    Instance LLM dùng chung cho mọi ExpenseExtractor.
+    Tạo lại khi đổi model; không cache khi tạo thất bại để lần sau thử lại.
+    """
+    global _cache_model_key
+    
+    key = (get_current_model(), get_fallback_model())
+    _cache_model_key = key
+    with _shared_llms_lock:
+        llm = _shared_llms.get(key)
+        if llm is None:
+            llm = create_llm_instance()
+            if llm is not None:
+                _shared_llms[key] = llm
+                # Mở kết nối/xác thực trước ở background để request đầu tiên không phải chờ
+                threading.Thread(target=_warm_up_llm, args=(llm,), daemon=True).start()
+    return llm
+
+def _warm_up_llm(llm):
+    """
+    Một request thật, giới hạn 1 token output, để mở kết nối HTTP/xác thực trước - bỏ qua mọi lỗi.
+    Ollama không cần: _preload_ollama_model đã load model.
+    """
+    # with_fallbacks() bọc model chính trong .runnable
+    model = getattr(llm, 'runnable', llm)
+    if not hasattr(model, 'max_output_tokens'):
+        return
+    try:
+        # Bản copy dùng chung client (connection pool) với model gốc, giữ timeout/max_retries
+        model.model_copy(update={'max_output_tokens': 1}).invoke("ok")
+    except Exception:
+        pass
+
 def create_llm_instance():
-    """Tạo instance LLM dựa trên cấu hình hiện tại"""
-    global _llm_available
+    """
+    Tạo instance LLM dựa trên cấu hình hiện tại.
+    Nếu có cấu hình fallback_llm_model, model dự phòng được gọi khi model chính lỗi/timeout
+    (sau đó mới tới rule-based parsing).
+    """
+    primary = _create_model_instance(get_current_model())
+    
+    fallback_model = get_fallback_model()
+    if not fallback_model or fallback_model == get_current_model():
+        return primary
     
+    backup = _create_model_instance(fallback_model)
+    if primary is None:
+        return backup
+    if backup is None:
+        return primary
+    return primary.with_fallbacks([backup])
+
+def _create_model_instance(model_name: str):
+    """Tạo instance LLM cho một model trong cấu hình"""
     try:
-        current_model = get_current_model()
-        model_settings = get_model_settings(current_model)
+        model_settings = get_model_settings(model_name)
         provider = model_settings["provider"]
         
         if provider == "google":
@@ -84,34 +513,52 @@ def create_llm_instance():
                 print(f"⚠️ Không tìm thấy {model_settings['api_key_env']} - chuyển sang chế độ offline")
                 return None
             
+            if not GOOGLE_GENAI_AVAILABLE:
+                print("⚠️ Cần cài đặt langchain-google-genai: uv add langchain-google-genai")
+                return None
+            
             from langchain_google_genai import ChatGoogleGenerativeAI
             
             return ChatGoogleGenerativeAI(
                 model=model_settings["model_name"],
                 google_api_key=api_key,
-                temperature=0.1
+                temperature=0.0,
+                max_output_tokens=_LLM_MAX_OUTPUT_TOKENS,
+                timeout=_LLM_REQUEST_TIMEOUT,
+                max_retries=_LLM_MAX_RETRIES
             )
             
         elif provider == "ollama":
             # Ollama models
-            try:
-                from langchain_ollama import ChatOllama
-                
-                # Test Ollama connection
-                if not _test_ollama_connection(model_settings["base_url"]):
-                    print(f"⚠️ Không thể kết nối Ollama tại {model_settings['base_url']}")
-                    print("💡 Hãy khởi động Ollama: ollama serve")
-                    return None
-                
-                return ChatOllama(
-                    model=model_settings["model_name"],
-                    base_url=model_settings["base_url"],
-                    temperature=0.1
-                )
-                
-            except ImportError:
+            if not OLLAMA_AVAILABLE:
                 print("⚠️ Cần cài đặt langchain-ollama: uv add langchain-ollama")
                 return None
+            
+            # Test Ollama connection
+            if not _test_ollama_connection(model_settings["base_url"]):
+                print(f"⚠️ Không thể kết nối Ollama tại {model_settings['base_url']}")
+                print("💡 Hãy khởi động Ollama: ollama serve")
+                return None
+            
+            # Load model vào RAM/VRAM ở background - tin nhắn đầu tiên không phải chờ load model
+            threading.Thread(
+                target=_preload_ollama_model,
+                args=(model_settings["base_url"], model_settings["model_name"]),
+                daemon=True
+            ).start()
+            
+            from langchain_ollama import ChatOllama
+            
+            return ChatOllama(
+                model=model_settings["model_name"],
+                base_url=model_settings["base_url"],
+                temperature=0.0,
+                num_predict=_LLM_MAX_OUTPUT_TOKENS,
+                # Ràng buộc decode ra JSON hợp lệ (grammar của llama.cpp) - không cần format_instructions
+                format="json",
+                keep_alive=_OLLAMA_KEEP_ALIVE,
+                client_kwargs={"timeout": _LLM_REQUEST_TIMEOUT}
+            )
         
         else:
             print(f"⚠️ Provider không hỗ trợ: {provider}")
@@ -121,101 +568,130 @@ def create_llm_instance():
         print(f"⚠️ Lỗi khởi tạo LLM: {e}")
         return None
 
-def _test_ollama_connection(base_url: str) -> bool:
-    """Test kết nối đến Ollama server"""
+def _preload_ollama_model(base_url: str, model_name: str):
+    """Request rỗng tới /api/generate chỉ load model (không sinh token) - bỏ qua mọi lỗi"""
     try:
-        import requests
-        response = requests.get(f"{base_url}/api/tags", timeout=3)
-        return response.status_code == 200
+        _probe_session.post(
+            f"{base_url}/api/generate",
+            json={"model": model_name, "prompt": "", "keep_alive": _OLLAMA_KEEP_ALIVE},
+            timeout=60
+        )
     except Exception:
-        return False
+        pass
+
+def _test_ollama_connection(base_url: str) -> bool:
+    """Test kết nối đến Ollama server"""
+    return _probe_url(f"{base_url}/api/tags", timeout=3)
 
-class QueryAnalyzer:
+def _rule_intent_analysis(message: str) -> Dict[str, Any]:
+    """Rule-based intent analysis (classify_and_extract và fallback khi offline)"""
+    scan = _scan_message(message)
+    hits = scan.hits
+    
+    # Simple keyword-based intent detection
+    if 'delete' in hits:
+        intent = 'delete_expense'
+        confidence = 0.9 if 'recent' in hits else 0.8
+    elif 'statistics' in hits:
+        intent = 'view_statistics'
+        confidence = 0.9 if _is_unambiguous_statistics(scan) else 0.8
+    elif 'balance' in hits:
+        intent = 'update_balance'
+        confidence = 0.9 if _is_unambiguous_balance(scan) else 0.7
+    elif 'expense' in hits:
+        intent = 'add_expense'
+        confidence = 0.9
+    elif scan.price > 0 and scan.meal_time:
+        # Không có từ khóa nhưng có giá tiền + bữa ăn (vd: "trưa phở 35k")
+        intent = 'add_expense'
+        confidence = 0.8
+    else:
+        intent = 'add_expense'  # Default to expense
+        confidence = 0.5
+    
+    # Nhiều intent cùng xuất hiện (vd: "xóa thống kê") - để LLM quyết định
+    if len(hits & _INTENT_TAGS) > 1:
+        confidence = min(confidence, 0.6)
+    
+    return {
+        'intent': intent,
+        'confidence': confidence,
+        'analysis': f'Rule-based detection: {intent}',
+        'offline_mode': True
+    }
+
+def _set_llm_offline():
+    """Chuyển sang rule-based cho các lượt sau (tới khi hết _LLM_RETRY_COOLDOWN)"""
+    global _llm_available, _llm_offline_since
+    _llm_available = False
+    _llm_offline_since = time.monotonic()
+
+def _llm_online() -> bool:
+    """_llm_available, tự bật lại khi đã offline quá _LLM_RETRY_COOLDOWN giây"""
+    global _llm_available
+    if (not _llm_available and _llm_offline_since is not None
+            and time.monotonic() - _llm_offline_since >= _LLM_RETRY_COOLDOWN):
+        _llm_available = True
+    return _llm_available
+
+def _online_llm(processor):
+    """LLM của processor nếu đang online (lấy lại instance dùng chung sau cooldown), None nếu offline"""
+    if not _llm_online():
+        return None
+    if processor.llm is None:
+        try:
+            processor.llm = get_shared_llm_instance()
+        except Exception as e:
+            logger.warning("⚠️ Lỗi khởi tạo LLM: %s", e)
+        if processor.llm is None:
+            _set_llm_offline()
+    return processor.llm
+
+def llm_status() -> Dict[str, Any]:
+    """Trạng thái LLM cho daemon báo cáo: đang online không, bao lâu nữa thử lại"""
+    online = _llm_online()
+    retry_in = None
+    if not online and _llm_offline_since is not None:
+        retry_in = max(0.0, _LLM_RETRY_COOLDOWN - (time.monotonic() - _llm_offline_since))
+    return {'llm_available': online, 'llm_retry_in': retry_in}
+
+class ExpenseExtractor:
     def __init__(self):
         """Khởi tạo LLM processor"""
-        global _llm_available
-        
         # Kiểm tra global flag trước
-        if not _llm_available:
+        if not _llm_online():
             self.llm = None
             return
             
         try:
-            # Test connection nhanh trước khi khởi tạo LLM
-            if not self._test_connection():
-                print("⚠️ Không có kết nối internet - chuyển sang chế độ offline")
-                _llm_available = False
-                self.llm = None
-                return
-            
-            # Sử dụng hàm create_llm_instance chung
-            self.llm = create_llm_instance()
+            # Dùng chung instance LLM với các processor khác
+            self.llm = get_shared_llm_instance()
             
             if self.llm is None:
-                _llm_available = False
+                _set_llm_offline()
                 
         except Exception as e:
-            print(f"⚠️ Lỗi khởi tạo QueryAnalyzer: {e} - chuyển sang chế độ offline")
-            _llm_available = False
+            print(f"⚠️ Lỗi khởi tạo ExpenseExtractor: {e}")
+            _set_llm_offline()
             self.llm = None
     
-    def _test_connection(self) -> bool:
-        """Test kết nối internet nhanh"""
-        try:
-            import requests
-            requests.get("https://www.google.com", timeout=2)
-            return True
-        except:
-            return False
-    
-    def analyze_intent(self, user_message: str) -> Dict[str, Any]:
-        """
-        Phân tích intent của user message với LLM
-        Returns: Dict với keys: intent, confidence, analysis
+    def extract_expense_info(self, user_message: str) -> Dict[str, Any]:
         """
-        global _llm_available
-        
-        if not _llm_available or not self.llm:
-            return self._fallback_intent_analysis(user_message)
-        
-        # Create Pydantic parser
-        parser = PydanticOutputParser(pydantic_object=IntentAnalysis)
-        
-        system_prompt = """
-        Bạn là chuyên gia phân tích intent từ câu chat tiếng Việt.
-        
-        Phân loại intent:
-        - "add_expense": thêm chi tiêu, ăn, uống, mua, chi tiêu, trả tiền
-        - "delete_expense": xóa, hủy, xoá giao dịch
-        - "update_balance": cập nhật số dư, set balance, thêm tiền vào tài khoản
-        - "view_statistics": thống kê, xem báo cáo, tổng kết
-        - "unknown": không rõ ràng
-        
-        {format_instructions}
+        Trích xuất thông tin chi tiêu từ tin nhắn của user với Pydantic
+        Returns: Dict với các keys: food_item, price, meal_time, confidence
         """
-        
-        prompt_template = PromptTemplate(
-            template=system_prompt + "\n\nCâu chat: '{user_message}'\n\nPhân tích:",
-            input_variables=["user_message"],
-            partial_variables={"format_instructions": parser.get_format_instructions()}
-        )
+        quick_result = self._quick_expense_extraction(user_message)
+        if quick_result is not None:
+            return quick_result
         
         try:
             # Create chain
-            chain = prompt_template | self.llm | parser
-            
-            # Invoke chain - NO timeout
-            response = chain.invoke({"user_message": user_message})
-            
-            # Convert Pydantic model to dict
-            result = {
-                'intent': response.intent,
-                'confidence': response.confidence,
-                'analysis': response.analysis,
-                'offline_mode': False
-            }
+            chain = _get_chain(_EXPENSE_PROMPT, self.llm)
             
-            return result
+            # Stream response, dừng khi JSON đóng - timeout do LLM client xử lý
+            response_text = _stream_until_json(chain, {"user_message": user_message})
+            response = _EXPENSE_PARSER.parse(_extract_json_block(response_text))
+            return self._expense_response_to_dict(response, user_message)
                 
         except Exception as e:
             error_msg = str(e)
@@ -224,143 +700,128 @@ class QueryAnalyzer:
             if "quota" in error_msg.lower() or "429" in error_msg:
                 if _llm_available:  # Only show once
                     print("⚠️ LLM quota exceeded")
-                _llm_available = False
+                _set_llm_offline()
             else:
-                print(f"⚠️ Lỗi khi gọi LLM: {error_msg[:50]}...")
-                _llm_available = False
+                logger.warning("⚠️ Lỗi khi gọi LLM: %s...", error_msg[:50])
+                _set_llm_offline()
                 
             # Fallback về rule-based parsing
-            return self._fallback_intent_analysis(user_message)
-    
-    def _fallback_intent_analysis(self, message: str) -> Dict[str, Any]:
-        """Fallback rule-based intent analysis khi LLM thất bại"""
-        message_lower = message.lower()
-        
-        # Simple keyword-based intent detection
-        if any(word in message_lower for word in ['xóa', 'xoá', 'hủy', 'delete']):
-            intent = 'delete_expense'
-            confidence = 0.8
-        elif any(word in message_lower for word in ['thống kê', 'statistic', 'báo cáo', 'tổng kết']):
-            intent = 'view_statistics'
-            confidence = 0.8
-        elif any(word in message_lower for word in ['số dư', 'balance', 'tài khoản', 'set']):
-            intent = 'update_balance'
-            confidence = 0.7
-        elif any(word in message_lower for word in ['ăn', 'uống', 'mua', 'chi tiêu', 'trả tiền']):
-            intent = 'add_expense'
-            confidence = 0.9
-        else:
-            intent = 'add_expense'  # Default to expense
-            confidence = 0.5
-        
-        return {
-            'intent': intent,
-            'confidence': confidence,
-            'analysis': f'Rule-based detection: {intent}',
-            'offline_mode': True
-        }
-
-class ExpenseExtractor:
-    def __init__(self):
-        """Khởi tạo LLM processor"""
-        global _llm_available
-        
-        # Kiểm tra global flag trước
-        if not _llm_available:
-            self.llm = None
-            return
-            
-        try:
-            # Sử dụng hàm create_llm_instance chung
-            self.llm = create_llm_instance()
-            
-            if self.llm is None:
-                _llm_available = False
-                
-        except Exception as e:
-            print(f"⚠️ Lỗi khởi tạo ExpenseExtractor: {e}")
-            _llm_available = False
-            self.llm = None
+            return self._fallback_extraction(user_message)
     
-    def extract_expense_info(self, user_message: str) -> Dict[str, Any]:
+    def extract_expense_infos(self, messages: List[str]) -> List[Dict[str, Any]]:
         """
-        Trích xuất thông tin chi tiêu từ tin nhắn của user với Pydantic
-        Returns: Dict với các keys: food_item, price, meal_time, confidence
+        extract_expense_info cho từng phần của tin nhắn nhiều giao dịch, giữ nguyên thứ tự.
+        Các lượt gọi LLM chạy song song (Ollama giải mã cùng lúc khi có OLLAMA_NUM_PARALLEL)
         """
-        global _llm_available
+        if len(messages) <= 1:
+            return [self.extract_expense_info(message) for message in messages]
         
-        if not _llm_available or not self.llm:
+        with ThreadPoolExecutor(max_workers=min(len(messages), _EXTRACT_MAX_WORKERS)) as executor:
+            return list(executor.map(self.extract_expense_info, messages))
+    
+    def _quick_expense_extraction(self, user_message: str) -> Optional[Dict[str, Any]]:
+        """Kết quả không cần gọi LLM (offline, rule-based đủ tin cậy hoặc đã cache), None nếu cần LLM"""
+        if _online_llm(self) is None:
             return self._fallback_extraction(user_message)
         
-        # Create Pydantic parser
-        parser = PydanticOutputParser(pydantic_object=ExpenseInfo)
-        
-        # Enhanced system prompt optimized for Llama3
-        system_prompt = """
-        Bạn là chuyên gia trích xuất thông tin tài chính từ văn bản tiếng Việt.
-        
-        Phân loại transaction_type:
-        - "income": lãnh lương, nhận tiền, thu nhập, được trả, tiền thưởng, tiền lương
-        - "expense": ăn, uống, mua, chi tiêu, trả tiền, mất tiền, tiêu
-        
-        Phân loại account_type (QUAN TRỌNG):
-        - "cash": tiền mặt, cash, tiền lẻ, tiền túi
-        - "account": tài khoản, ngân hàng, chuyển khoản, ck, bank, atm, banking
-        
-        QUAN TRỌNG - Price parsing:
-        - Nếu có "k" ở cuối số: nhân với 1000 (ví dụ: 35k = 35000, 5000k = 5000000)
-        - Nếu không có "k": giữ nguyên số
-        
-        QUAN TRỌNG - Account type keywords:
-        - "ck" = "chuyển khoản" → account_type PHẢI LÀ "account"
-        - "bank" = "ngân hàng" → account_type PHẢI LÀ "account"  
-        - "chuyển khoản" → account_type PHẢI LÀ "account"
-        - "cash" = "tiền mặt" → account_type PHẢI LÀ "cash"
+        # Có giá tiền và đúng một từ mô tả (vd: "phở 35k", không phải "cà phê 20k") thì không cần gọi LLM.
+        # Câu có dấu hiệu thu nhập (vd: "lương 5tr") để LLM quyết định loại giao dịch
+        fallback = self._fallback_extraction(user_message)
+        scan = _scan_message(user_message)
+        if (fallback['price'] > 0 and fallback['confidence'] >= _RULE_EXTRACTION_CONFIDENCE
+                and scan.descriptive_count == 1 and 'income' not in scan.hits):
+            fallback['offline_mode'] = False
+            return fallback
+        
+        cached = _get_cached_response('extract_expense_info', user_message)
+        if cached is None:
+            # Cùng cấu trúc câu, khác số tiền - dùng lại kết quả và lấy giá từ message hiện tại
+            cached = _get_cached_response('extract_expense_info', user_message, template=True)
+            if cached is not None:
+                cached['price'] = _scan_message(user_message).price
+        return cached
+    
+    def _expense_response_to_dict(self, response: ExpenseInfo, user_message: str) -> Dict[str, Any]:
+        """Convert Pydantic model sang dict, validate và cache kết quả"""
+        result = {
+            'food_item': response.food_item,
+            'price': response.price,
+            'meal_time': response.meal_time,
+            'transaction_type': response.transaction_type,
+            'account_type': response.account_type,
+            'confidence': response.confidence,
+            'offline_mode': False
+        }
         
-        {format_instructions}
+        # Validate and fix result
+        result = self._validate_and_fix_llm_result(result, user_message)
+        # Chỉ cache theo template khi giá LLM trả về đúng là số tiền trong câu
+        _cache_response('extract_expense_info', user_message, result,
+                        template=result['price'] == _scan_message(user_message).price)
+        return result
+    
+    def classify_and_extract(self, user_message: str) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
         """
-        
-        prompt_template = PromptTemplate(
-            template=system_prompt + "\n\nCâu chat: '{user_message}'\n\nTrích xuất:",
-            input_variables=["user_message"],
-            partial_variables={"format_instructions": parser.get_format_instructions()}
-        )
+        Phân tích intent và trích xuất chi tiêu trong cùng một lượt gọi LLM
+        Returns: (intent_result, expense_info) - expense_info là None khi chưa trích xuất được
+        (không phải add_expense, rule-based đủ tin cậy, hoặc LLM lỗi)
+        """
+        quick_result = self._quick_classify(user_message)
+        if quick_result is not None:
+            return quick_result, None
         
         try:
-            # Create chain
-            chain = prompt_template | self.llm | parser
-            
-            # Invoke chain - NO timeout
-            response = chain.invoke({"user_message": user_message})
-            
-            # Convert Pydantic model to dict
-            result = {
-                'food_item': response.food_item,
-                'price': response.price,
-                'meal_time': response.meal_time,
-                'transaction_type': response.transaction_type,
-                'account_type': response.account_type,
-                'confidence': response.confidence,
-                'offline_mode': False
-            }
+            chain = _get_chain(_INTENT_EXPENSE_PROMPT, self.llm)
             
-            # Validate and fix result
-            return self._validate_and_fix_llm_result(result, user_message)
+            # Stream response, dừng khi JSON đóng - timeout do LLM client xử lý
+            response_text = _stream_until_json(chain, {"user_message": user_message})
+            response = _INTENT_EXPENSE_PARSER.parse(_extract_json_block(response_text))
+            return self._combined_response_to_result(response, user_message)
                 
         except Exception as e:
-            error_msg = str(e)
-            
-            # Handle quota errors quietly
-            if "quota" in error_msg.lower() or "429" in error_msg:
-                if _llm_available:  # Only show once
-                    print("⚠️ LLM quota exceeded")
-                _llm_available = False
-            else:
-                print(f"⚠️ Lỗi khi gọi LLM: {error_msg[:50]}...")
-                _llm_available = False
-                
+            self._handle_llm_error(e)
             # Fallback về rule-based parsing
-            return self._fallback_extraction(user_message)
+            return _rule_intent_analysis(user_message), None
+    
+    def _quick_classify(self, user_message: str) -> Optional[Dict[str, Any]]:
+        """Intent không cần gọi LLM (offline, rule-based đủ tin cậy hoặc đã cache), None nếu cần LLM"""
+        intent_result = _rule_intent_analysis(user_message)
+        if _online_llm(self) is None:
+            return intent_result
+        
+        # Câu rõ ràng không cần LLM cho intent; extraction có fast path/cache riêng
+        if intent_result['confidence'] >= _RULE_INTENT_CONFIDENCE:
+            intent_result['offline_mode'] = False
+            return intent_result
+        
+        return _get_cached_response('analyze_intent', user_message, template=True)
+    
+    def _combined_response_to_result(self, response: IntentExpenseInfo, user_message: str):
+        """Tách response kết hợp thành (intent_result, expense_info) và cache kết quả"""
+        intent_result = {
+            'intent': response.intent,
+            'confidence': response.confidence,
+            'analysis': 'LLM intent (combined)',
+            'offline_mode': False
+        }
+        _cache_response('analyze_intent', user_message, intent_result, template=True)
+        
+        expense_info = None
+        if response.intent == 'add_expense' and response.expense is not None:
+            expense_info = self._expense_response_to_dict(response.expense, user_message)
+        return intent_result, expense_info
+    
+    def _handle_llm_error(self, error: Exception):
+        """Báo lỗi LLM và chuyển sang rule-based cho các lượt sau"""
+        error_msg = str(error) or type(error).__name__
+        
+        # Handle quota errors quietly
+        if "quota" in error_msg.lower() or "429" in error_msg:
+            if _llm_available:  # Only show once
+                print("⚠️ LLM quota exceeded")
+        else:
+            logger.warning("⚠️ Lỗi khi gọi LLM: %s...", error_msg[:50])
+        _set_llm_offline()
     
     def extract_delete_info(self, user_message: str) -> Dict[str, Any]:
         """
@@ -371,34 +832,17 @@ class ExpenseExtractor:
         if not self.llm:
             return self._fallback_delete_extraction(user_message)
         
-        # Create Pydantic parser
-        parser = PydanticOutputParser(pydantic_object=DeleteInfo)
-        
-        system_prompt = """
-        Bạn là chuyên gia trích xuất thông tin giao dịch cần xóa từ câu chat.
-        
-        Phân tích câu chat và xác định:
-        1. Có phải muốn xóa giao dịch gần nhất không
-        2. Hoặc xóa giao dịch cụ thể (theo tên món, giá, thời gian)
-        
-        Từ khóa xóa gần nhất: "xóa", "gần nhất", "recent", hoặc để trống
-        Từ khóa xóa cụ thể: tên món ăn, giá tiền, thời gian bữa ăn
-        
-        {format_instructions}
-        """
-        
-        prompt_template = PromptTemplate(
-            template=system_prompt + "\n\nCâu chat: '{user_message}'\n\nPhân tích:",
-            input_variables=["user_message"],
-            partial_variables={"format_instructions": parser.get_format_instructions()}
-        )
+        cached = _get_cached_response('extract_delete_info', user_message)
+        if cached is not None:
+            return cached
         
         try:
             # Create chain
-            chain = prompt_template | self.llm | parser
+            chain = _get_chain(_DELETE_PROMPT, self.llm)
             
-            # Invoke chain - NO timeout
-            response = chain.invoke({"user_message": user_message})
+            # Stream response, dừng khi JSON đóng - timeout do LLM client xử lý
+            response_text = _stream_until_json(chain, {"user_message": user_message})
+            response = _DELETE_PARSER.parse(_extract_json_block(response_text))
             
             # Convert Pydantic model to dict
             result = {
@@ -410,20 +854,21 @@ class ExpenseExtractor:
                 'offline_mode': False
             }
             
+            _cache_response('extract_delete_info', user_message, result)
             return result
                 
         except Exception as e:
             error_msg = str(e)
-            print(f"⚠️ Lỗi khi gọi LLM: {error_msg[:50]}...")
+            logger.warning("⚠️ Lỗi khi gọi LLM: %s...", error_msg[:50])
             return self._fallback_delete_extraction(user_message)
     
     def _fallback_delete_extraction(self, message: str) -> Dict[str, Any]:
         """Fallback rule-based delete extraction khi LLM thất bại"""
-        message_lower = message.lower()
+        hits = _scan_message(message).hits
         
         # Simple keyword-based detection
-        if any(word in message_lower for word in ['xóa', 'xoá', 'hủy', 'delete']):
-            if any(word in message_lower for word in ['gần nhất', 'recent', 'cuối']):
+        if 'delete' in hits:
+            if 'recent' in hits:
                 return {
                     'food_item': None,
                     'price': None,
@@ -454,23 +899,26 @@ class ExpenseExtractor:
     
     def _validate_and_fix_llm_result(self, result: Dict[str, Any], original_message: str) -> Dict[str, Any]:
         """Validate và fix kết quả từ LLM"""
+        price = result.get('price')
+        needs_price_check = isinstance(price, (int, float)) and price < 1000
+        needs_account_check = 'account_type' in result and result['account_type'] != 'account'
+        
+        # Kết quả hợp lệ (giá >= 1000, đã là account) - không cần quét lại message
+        if not needs_price_check and not needs_account_check:
+            return result
+        
+        scan = _scan_message(original_message)
         
         # Validate price (xử lý đơn vị k)
-        if 'price' in result:
-            price = result['price']
-            # Nếu price quá nhỏ và message chứa 'k', có thể LLM đã miss đơn vị
-            if price < 1000 and ('k' in original_message.lower() or 'K' in original_message):
-                # Tìm số có 'k' trong message
-                price_match = re.search(r'(\d+)k', original_message.lower())
-                if price_match:
-                    result['price'] = float(price_match.group(1)) * 1000
-                    print(f"🔧 Fixed price: {price} → {result['price']}")
-        
-        # Validate account_type for "ck" keyword
-        if 'account_type' in result and 'ck' in original_message.lower():
-            if result['account_type'] != 'account':
-                result['account_type'] = 'account'
-                print(f"🔧 Fixed account_type: {result['account_type']} → account (ck detected)")
+        # Nếu price quá nhỏ và message có giá dạng 'k', có thể LLM đã miss đơn vị
+        if needs_price_check and scan.price > price:
+            result['price'] = scan.price
+            logger.debug("🔧 Fixed price: %s → %s", price, result['price'])
+        
+        # Validate account_type for "ck" / "chuyển khoản" keyword
+        if needs_account_check and 'transfer' in scan.hits:
+            logger.debug("🔧 Fixed account_type: %s → account (ck detected)", result['account_type'])
+            result['account_type'] = 'account'
         
         return result
     
@@ -486,61 +934,38 @@ class ExpenseExtractor:
             'offline_mode': True
         }
         
-        message_lower = message.lower()
         confidence_boost = 0.0
         
+        # Quét keyword, giá tiền, bữa ăn, từ mô tả một lần
+        scan = _scan_message(message)
+        hits = scan.hits
+        
         # Phân tích transaction_type
-        income_keywords = ['lãnh lương', 'nhận tiền', 'thu nhập', 'được trả', 'tiền thưởng', 'tiền lương']
-        if any(keyword in message_lower for keyword in income_keywords):
+        if 'income' in hits:
             result['transaction_type'] = 'income'
             confidence_boost += 0.2
         
         # Phân tích account_type - Enhanced for llama3 testing
-        account_keywords = ['tài khoản', 'ngân hàng', 'account', 'atm', 'banking', 'chuyển khoản', 'vào tài khoản', 'ck', 'bank']
-        cash_keywords = ['tiền mặt', 'cash', 'tiền lẻ', 'tiền túi']
-        
         # Special handling for "ck" - must be account
-        if 'ck' in message_lower or 'chuyển khoản' in message_lower:
+        if 'transfer' in hits:
             result['account_type'] = 'account'
             confidence_boost += 0.2  # High confidence for explicit keywords
-        elif any(keyword in message_lower for keyword in account_keywords):
+        elif 'account' in hits:
             result['account_type'] = 'account'
             confidence_boost += 0.1
-        elif any(keyword in message_lower for keyword in cash_keywords):
+        elif 'cash' in hits:
             result['account_type'] = 'cash'
             confidence_boost += 0.1
         
-        # Enhanced price parsing - Fixed for large numbers
-        import re
-        price_patterns = [
-            r'(\d+)k\b',  # 35k, 5000k
-            r'(\d+)000\b',  # 35000
-            r'(\d+)\s*nghìn\b',  # 35 nghìn
-            r'(\d+\.\d+)k\b',  # 35.5k
-        ]
-        
-        for pattern in price_patterns:
-            match = re.search(pattern, message_lower)
-            if match:
-                price_str = match.group(1)
-                if 'k' in pattern or 'nghìn' in pattern:
-                    # Fixed: Always multiply by 1000 for "k" suffix
-                    result['price'] = float(price_str) * 1000
-                else:
-                    result['price'] = float(price_str)
-                confidence_boost += 0.2  # Có giá tiền rõ ràng
-                break
-        
-        # Tìm món ăn/mô tả giao dịch
-        words = message.split()
-        for word in words:
-            word_clean = re.sub(r'\d+k?', '', word.lower()).strip()
-            # Loại bỏ các từ thời gian và action
-            skip_words = ['sáng', 'trưa', 'chiều', 'tối', 'ăn', 'uống', 'mua', 'ck', 'bank', 'cash']
-            if word_clean not in skip_words and len(word_clean) > 2:
-                result['food_item'] = word_clean
-                confidence_boost += 0.1
-                break
+        # Enhanced price parsing - một lần quét cho tất cả định dạng giá
+        if scan.price:
+            result['price'] = scan.price
+            confidence_boost += 0.2  # Có giá tiền rõ ràng
+        
+        # Tìm món ăn/mô tả giao dịch (loại bỏ các từ thời gian và action)
+        if scan.food_words:
+            result['food_item'] = scan.food_words[0]
+            confidence_boost += 0.1
         
         if not result['food_item']:
             if result['transaction_type'] == 'income':
@@ -549,18 +974,9 @@ class ExpenseExtractor:
                 result['food_item'] = 'chi tiêu'
         
         # Phân tích meal_time
-        meal_time_keywords = {
-            'sáng': 'sáng',
-            'trưa': 'trưa', 
-            'chiều': 'chiều',
-            'tối': 'tối'
-        }
-        
-        for keyword, meal_time in meal_time_keywords.items():
-            if keyword in message_lower:
-                result['meal_time'] = meal_time
-                confidence_boost += 0.1
-                break
+        if scan.meal_time:
+            result['meal_time'] = scan.meal_time
+            confidence_boost += 0.1
         
         # Cập nhật confidence
         result['confidence'] = min(0.9, 0.3 + confidence_boost)
@@ -576,74 +992,81 @@ class ExpenseExtractor:
         if not self.llm:
             return self._fallback_balance_update(user_message)
         
-        # Create Pydantic parser
-        parser = PydanticOutputParser(pydantic_object=BalanceUpdate)
-        
-        system_prompt = """
-        Bạn là chuyên gia trích xuất thông tin cập nhật số dư từ câu chat.
-        
-        Phân tích:
-        1. Có phải muốn cập nhật số dư không
-        2. Loại operation: SET (đặt số dư cụ thể) hoặc ADD (thêm/bớt)
-        3. Số tiền cho cash và account
-        
-        {format_instructions}
-        """
+        # Không nhắc tới số dư/tài khoản/tiền mặt - không phải cập nhật số dư
+        if not _has_balance_signal(_scan_message(user_message)):
+            return None
         
-        prompt_template = PromptTemplate(
-            template=system_prompt + "\n\nCâu chat: '{user_message}'\n\nPhân tích:",
-            input_variables=["user_message"],
-            partial_variables={"format_instructions": parser.get_format_instructions()}
-        )
+        quick_result = self._quick_balance_update(user_message)
+        if quick_result is not None:
+            return quick_result
         
         try:
-            # Create chain
-            chain = prompt_template | self.llm | parser
-            
-            # Invoke chain - NO timeout
-            response = chain.invoke({"user_message": user_message})
-            
-            # Convert Pydantic model to dict
-            result = {
-                'is_balance_update': response.is_balance_update,
-                'operation_type': response.operation_type,
-                'cash_balance': response.cash_balance,
-                'account_balance': response.account_balance,
-                'cash_amount': response.cash_amount,
-                'account_amount': response.account_amount,
-                'description': response.description,
-                'offline_mode': False
-            }
-            
-            return result if result['is_balance_update'] else None
+            # Stream response, dừng khi JSON đóng - timeout do LLM client xử lý
+            llm_chain, parser = self._balance_chain()
+            response_text = _stream_until_json(llm_chain, {"user_message": user_message})
+            response = parser.parse(_extract_json_block(response_text))
+            return self._balance_response_to_dict(response, user_message)
                 
         except Exception as e:
             error_msg = str(e)
-            print(f"⚠️ Lỗi khi gọi LLM: {error_msg[:50]}...")
+            logger.warning("⚠️ Lỗi khi gọi LLM: %s...", error_msg[:50])
             return self._fallback_balance_update(user_message)
     
+    def _quick_balance_update(self, user_message: str) -> Optional[Dict[str, Any]]:
+        """Kết quả không cần gọi LLM (SET rõ ràng hoặc đã cache), None nếu cần LLM"""
+        # SET số dư rõ ràng (vd: "set tiền mặt 500k") thì không cần gọi LLM
+        if _is_unambiguous_balance(_scan_message(user_message)):
+            result = self._fallback_balance_update(user_message)
+            if result:
+                result['offline_mode'] = False
+                return result
+        
+        return _get_cached_response('extract_balance_update', user_message)
+    
+    def _balance_chain(self):
+        """Chain prompt | LLM và parser cho balance update"""
+        return _get_chain(_BALANCE_PROMPT, self.llm), _get_fixing_parser(_BALANCE_PARSER, self.llm)
+    
+    def _balance_response_to_dict(self, response: BalanceUpdate, user_message: str) -> Optional[Dict[str, Any]]:
+        """Convert Pydantic model sang dict và cache kết quả"""
+        result = {
+            'is_balance_update': response.is_balance_update,
+            'operation_type': response.operation_type,
+            'cash_balance': response.cash_balance,
+            'account_balance': response.account_balance,
+            'cash_amount': response.cash_amount,
+            'account_amount': response.account_amount,
+            'description': response.description,
+            'offline_mode': False
+        }
+        
+        if not result['is_balance_update']:
+            return None
+        
+        _cache_response('extract_balance_update', user_message, result)
+        return result
+    
     def _fallback_balance_update(self, message: str) -> Optional[Dict[str, float]]:
         """Fallback rule-based balance update extraction"""
-        message_lower = message.lower()
+        scan = _scan_message(message)
         
         # Simple keyword detection
-        balance_keywords = ['số dư', 'balance', 'tài khoản', 'set']
-        if not any(keyword in message_lower for keyword in balance_keywords):
+        if 'balance' not in scan.hits:
             return None
         
         # Try to extract amounts
-        import re
-        amounts = re.findall(r'(\d+)k', message_lower)
-        if amounts:
-            amount = float(amounts[0]) * 1000
+        amount = scan.price
+        if amount:
+            # Chỉ nhắc tới tài khoản (không có tiền mặt) thì set số dư tài khoản
+            is_account = 'account' in scan.hits and 'cash' not in scan.hits
             return {
                 'is_balance_update': True,
                 'operation_type': 'set',
-                'cash_balance': amount,
-                'account_balance': None,
+                'cash_balance': None if is_account else amount,
+                'account_balance': amount if is_account else None,
                 'cash_amount': None,
                 'account_amount': None,
-                'description': f'Set balance to {amount}',
+                'description': f"Set {'account' if is_account else 'cash'} balance to {amount}",
                 'offline_mode': True
             }
         
@@ -652,67 +1075,75 @@ class ExpenseExtractor:
     def extract_statistics_info(self, user_message: str) -> Dict[str, Any]:
         """
         Trích xuất thông tin thống kê với Pydantic
-        Returns: Dict với period và specific_date
+        Returns: Dict với period, days và specific_date
         """
         
         if not self.llm:
             return self._fallback_statistics_extraction(user_message)
         
-        # Create Pydantic parser
-        parser = PydanticOutputParser(pydantic_object=StatisticsInfo)
-        
-        system_prompt = """
-        Bạn là chuyên gia trích xuất thông tin thống kê từ câu chat.
+        # Khoảng thời gian rõ ràng thì rule-based là đủ, không cần gọi LLM
+        if _is_unambiguous_statistics(_scan_message(user_message)):
+            result = self._fallback_statistics_extraction(user_message)
+            result['offline_mode'] = False
+            return result
         
-        Phân tích:
-        1. Period: daily, weekly, monthly
-        2. Specific date nếu có
+        cached = _get_cached_response('extract_statistics_info', user_message)
+        if cached is not None:
+            return cached
         
-        {format_instructions}
-        """
-        
-        prompt_template = PromptTemplate(
-            template=system_prompt + "\n\nCâu chat: '{user_message}'\n\nPhân tích:",
-            input_variables=["user_message"],
-            partial_variables={"format_instructions": parser.get_format_instructions()}
-        )
+        parser = _get_fixing_parser(_STATISTICS_PARSER, self.llm)
         
         try:
             # Create chain
-            chain = prompt_template | self.llm | parser
+            chain = _get_chain(_STATISTICS_PROMPT, self.llm)
             
-            # Invoke chain - NO timeout
-            response = chain.invoke({"user_message": user_message})
+            # Stream response, dừng khi JSON đóng - timeout do LLM client xử lý
+            response_text = _stream_until_json(chain, {"user_message": user_message})
+            response = parser.parse(_extract_json_block(response_text))
             
             # Convert Pydantic model to dict
             result = {
                 'period': response.period,
+                'days': _PERIOD_DAYS.get(response.period, 1),
                 'specific_date': response.specific_date,
                 'confidence': response.confidence,
                 'offline_mode': False
             }
             
+            # Không cần quét lại "N ngày": câu có số ngày đã được
+            # _is_unambiguous_statistics trả về bằng rule-based ở trên
+            
+            _cache_response('extract_statistics_info', user_message, result)
             return result
                 
         except Exception as e:
             error_msg = str(e)
-            print(f"⚠️ Lỗi khi gọi LLM: {error_msg[:50]}...")
+            logger.warning("⚠️ Lỗi khi gọi LLM: %s...", error_msg[:50])
             return self._fallback_statistics_extraction(user_message)
     
     def _fallback_statistics_extraction(self, message: str) -> Dict[str, Any]:
         """Fallback rule-based statistics extraction"""
-        message_lower = message.lower()
+        scan = _scan_message(message)
+        hits = scan.hits
         
         # Simple keyword detection
-        if 'tuần' in message_lower or 'week' in message_lower:
+        day_match = _DAY_RE.search(scan.message_lower)
+        if day_match and int(day_match.group(1)) > 0:
+            period = 'custom'
+            days = int(day_match.group(1))
+        elif 'week' in hits:
             period = 'weekly'
-        elif 'tháng' in message_lower or 'month' in message_lower:
+            days = 7
+        elif 'month' in hits:
             period = 'monthly'
+            days = 30
         else:
             period = 'daily'  # Default
+            days = 1
         
         return {
             'period': period,
+            'days': days,
             'specific_date': None,
             'confidence': 0.7,
             'offline_mode': True
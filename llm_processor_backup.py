@@ -2,11 +2,15 @@ import os
 import re
 import datetime
 import logging
+import socket
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from typing import Dict, Optional, Any, List
+import requests
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 from langchain.output_parsers import PydanticOutputParser
-from langchain.prompts import PromptTemplate
 from config import get_current_model, get_model_settings
 
 # Suppress verbose langchain retry logs
@@ -21,6 +25,164 @@ load_dotenv()
 _llm_available = True
 _offline_warning_shown = False
 
+# Timeout mỗi request LLM - do client tự hủy request (thay signal.SIGALRM - chỉ dùng được ở main thread)
+_OLLAMA_TIMEOUT = 15  # Ollama: model load + inference
+_API_TIMEOUT = 5  # Google API
+
+# LRU cache kết quả LLM theo (method, message đã chuẩn hóa)
+_RESPONSE_CACHE_SIZE = 512
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+# Precompiled regex patterns cho rule-based parsing
+# Intent patterns (theo thứ tự ưu tiên: delete > balance > statistics)
+_DELETE_INTENT_RES = tuple(re.compile(p) for p in (
+    r'(xóa|xoá|hủy|bỏ|delete|remove)',
+    r'(xóa\s*(giao\s*dịch|transaction))',
+    r'(hủy\s*(giao\s*dịch|transaction))',
+))
+_BALANCE_INTENT_RES = tuple(re.compile(p) for p in (
+    r'(cập\s*nhật|update).*(số\s*dư|balance|tiền)',
+    r'(thiết\s*lập|đặt|set).*(số\s*dư|balance)',
+    r'(số\s*dư|balance).*(là|thành|=)',
+    r'(tiền\s*mặt|cash).*(là|thành|chỉ\s*có)',
+    r'(tài\s*khoản|account).*(là|thành|chỉ\s*có)',
+))
+_STATS_INTENT_RES = tuple(re.compile(p) for p in (
+    r'(thống\s*kê|statistic|báo\s*cáo|report)',
+    r'(hôm\s*nay|today|daily)',
+    r'(tuần|week|weekly)',
+    r'(tháng|month|monthly)',
+    r'(xem|show|hiển\s*thị).*(chi\s*tiêu|expense)',
+))
+_INTENT_PRICE_RE = re.compile(r'\d+[k\.]?\d*[k]?')
+
+# Số tiền: một lần search, nhóm nào khớp quyết định hệ số nhân (35000 -> nhóm 'th' = 35 x 1000)
+_DELETE_AMOUNT_RE = re.compile(r'(?P<k>\d+(?:\.\d+)?)k|(?P<th>\d+)000|(?P<nghin>\d+)\s*nghìn')
+_EXPENSE_AMOUNT_RE = re.compile(
+    r'(?P<k>\d+(?:\.\d+)?)k\b|(?P<th>\d+)000\b|(?P<nghin>\d+)\s*nghìn\b'  # 35k/35.5k, 35000, 35 nghìn
+)
+_BALANCE_AMOUNT_RE = re.compile(
+    r'(?P<trieu>\d+)\s*triệu\b|(?P<nghin>\d+)\s*nghìn\b|(?P<k>\d+)k\b|(?P<th>\d+)000\b'
+)
+_AMOUNT_MULTIPLIERS = {'trieu': 1000000, 'nghin': 1000, 'k': 1000, 'th': 1000}
+_PRICE_K_RE = re.compile(r'(\d+)k')
+# Token chỉ là số tiền (35k, 35.5k, 35000)
+_AMOUNT_WORD_RE = re.compile(r'^\d+[k.]?\d*[k]?$')
+# Bỏ số tiền khỏi một từ ("phở35k" -> "phở")
+_RE_STRIP_AMT = re.compile(r'\d+k?')
+
+
+
+
+def _keyword_re(*keywords: str) -> re.Pattern:
+    """Một regex alternation thay cho any(keyword in text for keyword in keywords)"""
+    return re.compile('|'.join(map(re.escape, keywords)))
+
+
+# Keyword scanners - mỗi cái quét message một lần thay vì N lần `in`
+_DELETE_MEAL_PATTERNS = (
+    ('sáng', _keyword_re('sáng', 'buổi sáng')),
+    ('trưa', _keyword_re('trưa', 'buổi trưa')),
+    ('chiều', _keyword_re('chiều', 'buổi chiều')),
+    ('tối', _keyword_re('tối', 'buổi tối')),
+)
+_MEAL_PATTERNS = (
+    ('sáng', _keyword_re('sáng', 'buổi sáng')),
+    ('trưa', _keyword_re('trưa', 'buổi trưa', 'lunch')),
+    ('chiều', _keyword_re('chiều', 'buổi chiều', 'afternoon')),
+    ('tối', _keyword_re('tối', 'buổi tối', 'dinner', 'supper')),
+)
+_DELETE_FOOD_RE = _keyword_re('ăn', 'uống', 'mua')
+_FOOD_RE = _keyword_re('ăn', 'uống', 'mua', 'order', 'gọi')
+
+_VALIDATE_INCOME_RE = _keyword_re('lãnh lương', 'nhận tiền', 'thu nhập', 'được trả', 'tiền thưởng', 'lương', 'salary')
+_VALIDATE_ACCOUNT_RE = _keyword_re('tài khoản', 'ngân hàng', 'account', 'atm', 'banking', 'chuyển khoản', 'ck', 'bank')
+_CASH_RE = _keyword_re('tiền mặt', 'cash', 'tiền lẻ', 'tiền túi')
+
+_EXPENSE_INCOME_RE = _keyword_re('lãnh', 'lương', 'nhận', 'thu', 'được', 'thưởng', 'salary', 'income', 'tiền lương')
+_EXPENSE_EXPENSE_RE = _keyword_re('ăn', 'uống', 'mua', 'chi', 'tiêu', 'trả', 'spend')
+_EXPENSE_ACCOUNT_RE = _keyword_re('tài khoản', 'ngân hàng', 'account', 'atm', 'banking', 'chuyển khoản', 'vào tài khoản', 'ck', 'bank')
+_CK_RE = _keyword_re('ck', 'chuyển khoản')
+
+_BALANCE_GATE_RE = _keyword_re('cập nhật', 'update', 'tiền mặt', 'tài khoản', 'lãnh lương', 'nhận tiền', 'chi tiêu')
+_BALANCE_SET_RE = _keyword_re('cập nhật lại', 'chỉ có', 'là', 'thành', 'đặt lại', 'reset', 'thiết lập')
+_BALANCE_ADD_RE = _keyword_re('lãnh', 'lương', 'nhận', 'thu', 'được', 'thưởng', 'chi', 'tiêu', 'mất', 'trả')
+_BALANCE_ACCOUNT_RE = _keyword_re('tài khoản', 'ngân hàng', 'account', 'atm', 'vào tài khoản')
+_BALANCE_INCOME_RE = _keyword_re('lãnh', 'lương', 'nhận', 'thu', 'được', 'thưởng', 'cập nhật', 'còn', 'có')
+_BALANCE_EXPENSE_RE = _keyword_re('chi', 'tiêu', 'mất', 'trả', 'spend')
+
+# Từ thời gian/action bỏ qua khi đoán món ăn (membership test)
+_SKIP_WORDS = frozenset({
+    'sáng', 'trưa', 'chiều', 'tối', 'ăn', 'uống', 'mua', 'order', 'gọi', 'buổi',
+    'lãnh', 'nhận', 'từ', 'vào', 'tài', 'khoản', 'tiền', 'mặt',
+})
+_MEAL_TIME_WORDS = frozenset({'sáng', 'trưa', 'chiều', 'tối'})
+# Từ không thể là tên món khi sửa food_item của LLM
+_NON_FOOD_WORDS = frozenset({'ăn', 'uống', 'mua', 'cash', 'bank', 'ck'}) | _MEAL_TIME_WORDS
+_GENERIC_DESCRIPTIONS = frozenset({'thu nhập', 'chi tiêu'})
+_VALID_TRANSACTION_TYPES = frozenset({'expense', 'income'})
+_VALID_ACCOUNT_TYPES = frozenset({'cash', 'account'})
+# Thứ tự ưu tiên khi chọn mô tả thu nhập
+_INCOME_DESCRIPTIONS = ('lương', 'thưởng', 'thu nhập', 'tiền lương', 'nhận tiền')
+_DELETE_WORDS = ('xóa', 'xoá', 'hủy', 'bỏ', 'delete', 'remove', 'giao dịch')
+
+_STATS_PERIOD_PATTERNS = (
+    ('daily', _keyword_re('hôm nay', 'today', 'daily')),
+    ('weekly', _keyword_re('tuần', 'week', 'weekly')),
+    ('monthly', _keyword_re('tháng', 'month', 'monthly')),
+)
+
+
+def _parse_amount(amount_re: re.Pattern, text: str) -> float:
+    """Số tiền đầu tiên amount_re tìm thấy trong text, 0.0 nếu không có"""
+    match = amount_re.search(text)
+    if not match:
+        return 0.0
+    return float(match.group(match.lastgroup)) * _AMOUNT_MULTIPLIERS[match.lastgroup]
+
+
+def _parse_balance_amount(message_lower: str) -> float:
+    """Số tiền trong câu cập nhật số dư (500k, 2 triệu, 300 nghìn, 150000), 0.0 nếu không có"""
+    return _parse_amount(_BALANCE_AMOUNT_RE, message_lower)
+
+
+def _is_unambiguous_balance(message_lower: str) -> bool:
+    """SET số dư rõ ràng: có từ khóa set, có số tiền và chỉ một loại tài khoản"""
+    return (_BALANCE_GATE_RE.search(message_lower) is not None
+            and _BALANCE_SET_RE.search(message_lower) is not None
+            and (_BALANCE_ACCOUNT_RE.search(message_lower) is None) != (_CASH_RE.search(message_lower) is None)
+            and _parse_balance_amount(message_lower) > 0)
+
+
+def _get_cached_response(method: str, message: str) -> Optional[Dict[str, Any]]:
+    """Lấy kết quả LLM đã cache (trả về bản copy để tránh bị sửa đổi)"""
+    key = (method, message.strip().lower())
+    with _response_cache_lock:
+        cached = _response_cache.get(key)
+        if cached is None:
+            return None
+        _response_cache.move_to_end(key)
+    return dict(cached)
+
+
+def _cache_response(method: str, message: str, result: Dict[str, Any]):
+    """Lưu kết quả LLM vào cache, loại bỏ entry cũ nhất khi đầy"""
+    key = (method, message.strip().lower())
+    with _response_cache_lock:
+        _response_cache[key] = dict(result)
+        if len(_response_cache) > _RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+
+
+@lru_cache(maxsize=256)
+def _stats_period(message_lower: str) -> tuple:
+    """(period, confidence) cho statistics fallback - message đã lower/strip"""
+    for period, pattern in _STATS_PERIOD_PATTERNS:
+        if pattern.search(message_lower):
+            return period, 0.8
+    return 'daily', 0.5  # Default
+
 
 # Pydantic Models for LLM Response Schemas
 class IntentAnalysis(BaseModel):
@@ -67,6 +229,121 @@ class StatisticsInfo(BaseModel):
     confidence: float = Field(description="Confidence level (0.0-1.0)", ge=0.0, le=1.0)
 
 
+# Prompt dựng sẵn một lần (format_instructions đã điền) - gọi thẳng self.llm.invoke
+# thay vì dựng PromptTemplate | llm | parser cho mỗi câu
+_INTENT_PARSER = PydanticOutputParser(pydantic_object=IntentAnalysis)
+_INTENT_SYSTEM_PROMPT = """
+    Bạn là chuyên gia phân tích ý định (intent) từ câu chat về chi tiêu.
+    
+    Phân tích câu chat và xác định intent:
+    1. "add_expense" - Thêm giao dịch chi tiêu hoặc thu nhập
+    2. "delete_expense" - Xóa giao dịch 
+    3. "update_balance" - Cập nhật số dư tài khoản
+    4. "view_statistics" - Xem thống kê 
+    5. "unknown" - Không rõ ý định
+    
+    Ví dụ phân loại:
+    - "ăn phở 30k" → add_expense
+    - "lãnh lương 5000k" → add_expense  
+    - "xóa phở" → delete_expense
+    - "cập nhật tiền mặt 200k" → update_balance
+    - "thống kê hôm nay" → view_statistics
+    
+    {format_instructions}
+    """
+_INTENT_PROMPT = _INTENT_SYSTEM_PROMPT.format(
+    format_instructions=_INTENT_PARSER.get_format_instructions()
+)
+
+_EXPENSE_PARSER = PydanticOutputParser(pydantic_object=ExpenseInfo)
+# Enhanced system prompt optimized for Llama3
+_EXPENSE_SYSTEM_PROMPT = """
+    Bạn là chuyên gia trích xuất thông tin tài chính từ văn bản tiếng Việt.
+    
+    Phân loại transaction_type:
+    - "income": lãnh lương, nhận tiền, thu nhập, được trả, tiền thưởng, tiền lương
+    - "expense": ăn, uống, mua, chi tiêu, trả tiền, mất tiền, tiêu
+    
+    Phân loại account_type (QUAN TRỌNG):
+    - "cash": tiền mặt, cash, tiền lẻ, tiền túi
+    - "account": tài khoản, ngân hàng, chuyển khoản, ck, bank, atm, banking
+    
+    QUAN TRỌNG - Price parsing:
+    - Nếu có "k" ở cuối số: nhân với 1000 (ví dụ: 35k = 35000, 5000k = 5000000)
+    - Nếu không có "k": giữ nguyên số
+    
+    QUAN TRỌNG - Account type keywords:
+    - "ck" = "chuyển khoản" → account_type PHẢI LÀ "account"
+    - "bank" = "ngân hàng" → account_type PHẢI LÀ "account"  
+    - "chuyển khoản" → account_type PHẢI LÀ "account"
+    - "cash" = "tiền mặt" → account_type PHẢI LÀ "cash"
+    
+    {format_instructions}
+    """
+_EXPENSE_PROMPT = _EXPENSE_SYSTEM_PROMPT.format(
+    format_instructions=_EXPENSE_PARSER.get_format_instructions()
+)
+
+_DELETE_PARSER = PydanticOutputParser(pydantic_object=DeleteInfo)
+_DELETE_SYSTEM_PROMPT = """
+    Bạn là chuyên gia trích xuất thông tin giao dịch cần xóa từ câu chat.
+    
+    Phân tích câu chat và xác định:
+    1. Có phải muốn xóa giao dịch gần nhất không
+    2. Hoặc xóa giao dịch cụ thể (theo tên món, giá, thời gian)
+    
+    Từ khóa xóa gần nhất: "xóa", "gần nhất", "recent", hoặc để trống
+    Từ khóa xóa cụ thể: tên món ăn, giá tiền, thời gian bữa ăn
+    
+    {format_instructions}
+    """
+_DELETE_PROMPT = _DELETE_SYSTEM_PROMPT.format(
+    format_instructions=_DELETE_PARSER.get_format_instructions()
+)
+
+_BALANCE_PARSER = PydanticOutputParser(pydantic_object=BalanceUpdate)
+_BALANCE_SYSTEM_PROMPT = """
+    Bạn là chuyên gia phân tích câu lệnh cập nhật số dư tài chính.
+    
+    CÓ 2 LOẠI THAO TÁC:
+    1. THIẾT LẬP (SET): Đặt số dư về một giá trị cụ thể
+    2. CỘNG/TRỪ (ADD): Cộng/trừ vào số dư hiện tại
+    
+    PHÂN LOẠI THEO TỪ KHÓA:
+    - SET: "cập nhật lại", "chỉ có", "là", "thành", "đặt lại", "reset"
+    - ADD: "lãnh lương", "nhận tiền", "thu nhập", "chi tiêu", "mất tiền"
+    
+    {format_instructions}
+    """
+_BALANCE_PROMPT = _BALANCE_SYSTEM_PROMPT.format(
+    format_instructions=_BALANCE_PARSER.get_format_instructions()
+)
+
+_STATISTICS_PARSER = PydanticOutputParser(pydantic_object=StatisticsInfo)
+_STATISTICS_SYSTEM_PROMPT = """
+    Bạn là chuyên gia trích xuất thông tin yêu cầu thống kê chi tiêu.
+    
+    Phân tích câu chat và xác định:
+    1. Khoảng thời gian thống kê: daily, weekly, monthly
+    2. Ngày cụ thể nếu có (định dạng YYYY-MM-DD)
+    
+    Từ khóa nhận biết:
+    - "hôm nay", "today" → daily
+    - "tuần", "week" → weekly  
+    - "tháng", "month" → monthly
+    
+    {format_instructions}
+    """
+_STATISTICS_PROMPT = _STATISTICS_SYSTEM_PROMPT.format(
+    format_instructions=_STATISTICS_PARSER.get_format_instructions()
+)
+
+
+def _build_prompt(system_prompt: str, user_message: str, action: str = "Phân tích") -> str:
+    """Ghép system prompt với câu chat - không đi qua format() nên an toàn với {}"""
+    return system_prompt + f"\n\nCâu chat: '{user_message}'\n\n{action}:"
+
+
 def create_llm_instance():
     """Tạo instance LLM dựa trên cấu hình hiện tại"""
     global _llm_available
@@ -88,7 +365,9 @@ def create_llm_instance():
             return ChatGoogleGenerativeAI(
                 model=model_settings["model_name"],
                 google_api_key=api_key,
-                temperature=0.1
+                temperature=0.1,
+                timeout=_API_TIMEOUT,
+                max_retries=1
             )
             
         elif provider == "ollama":
@@ -106,7 +385,7 @@ def create_llm_instance():
                     model=model_settings["model_name"],
                     base_url=model_settings["base_url"],
                     temperature=0.1,
-                    timeout=30  # 30 giây timeout cho Ollama
+                    client_kwargs={"timeout": _OLLAMA_TIMEOUT}
                 )
                 
             except ImportError:
@@ -124,7 +403,6 @@ def create_llm_instance():
 def _test_ollama_connection(base_url: str) -> bool:
     """Test kết nối đến Ollama server"""
     try:
-        import requests
         response = requests.get(f"{base_url}/api/tags", timeout=3)
         return response.status_code == 200
     except Exception:
@@ -157,7 +435,6 @@ class QueryAnalyzer:
     def _test_connection(self) -> bool:
         """Test kết nối internet nhanh"""
         try:
-            import socket
             socket.create_connection(("8.8.8.8", 53), timeout=2)
             return True
         except (OSError, socket.timeout):
@@ -210,43 +487,10 @@ class QueryAnalyzer:
     
     def _analyze_with_llm(self, user_message: str) -> Dict[str, Any]:
         """Phân tích với LLM - với timeout và Pydantic parser"""
-        from langchain.schema import HumanMessage, SystemMessage
-        
-        # Create Pydantic parser
-        parser = PydanticOutputParser(pydantic_object=IntentAnalysis)
-        
-        system_prompt = """
-        Bạn là chuyên gia phân tích ý định (intent) từ câu chat về chi tiêu.
-        
-        Phân tích câu chat và xác định intent:
-        1. "add_expense" - Thêm giao dịch chi tiêu hoặc thu nhập
-        2. "delete_expense" - Xóa giao dịch 
-        3. "update_balance" - Cập nhật số dư tài khoản
-        4. "view_statistics" - Xem thống kê 
-        5. "unknown" - Không rõ ý định
-        
-        Ví dụ phân loại:
-        - "ăn phở 30k" → add_expense
-        - "lãnh lương 5000k" → add_expense  
-        - "xóa phở" → delete_expense
-        - "cập nhật tiền mặt 200k" → update_balance
-        - "thống kê hôm nay" → view_statistics
-        
-        {format_instructions}
-        """
-        
-        prompt_template = PromptTemplate(
-            template=system_prompt + "\n\nCâu chat: '{user_message}'\n\nPhân tích:",
-            input_variables=["user_message"],
-            partial_variables={"format_instructions": parser.get_format_instructions()}
-        )
         
         try:
-            # Create chain
-            chain = prompt_template | self.llm | parser
-            
-            # Invoke chain
-            response = chain.invoke({"user_message": user_message})
+            raw = self.llm.invoke(_build_prompt(_INTENT_PROMPT, user_message))
+            response = _INTENT_PARSER.parse(raw.content)
             
             return {
                 'intent': response.intent,
@@ -267,36 +511,11 @@ class QueryAnalyzer:
         """Enhanced rule-based intent analysis cho chế độ offline"""
         message_lower = message.lower().strip()
         
-        # Enhanced delete patterns
-        delete_patterns = [
-            r'(xóa|xoá|hủy|bỏ|delete|remove)',
-            r'(xóa\s*(giao\s*dịch|transaction))',
-            r'(hủy\s*(giao\s*dịch|transaction))'
-        ]
-        
-        # Enhanced balance update patterns  
-        balance_patterns = [
-            r'(cập\s*nhật|update).*(số\s*dư|balance|tiền)',
-            r'(thiết\s*lập|đặt|set).*(số\s*dư|balance)',
-            r'(số\s*dư|balance).*(là|thành|=)',
-            r'(tiền\s*mặt|cash).*(là|thành|chỉ\s*có)',
-            r'(tài\s*khoản|account).*(là|thành|chỉ\s*có)'
-        ]
-        
-        # Enhanced statistics patterns
-        stats_patterns = [
-            r'(thống\s*kê|statistic|báo\s*cáo|report)',
-            r'(hôm\s*nay|today|daily)',
-            r'(tuần|week|weekly)',
-            r'(tháng|month|monthly)',
-            r'(xem|show|hiển\s*thị).*(chi\s*tiêu|expense)'
-        ]
-        
         confidence = 0.7
         
         # Check patterns
-        for pattern in delete_patterns:
-            if re.search(pattern, message_lower):
+        for pattern in _DELETE_INTENT_RES:
+            if pattern.search(message_lower):
                 return {
                     'intent': 'delete_expense',
                     'confidence': confidence,
@@ -304,8 +523,8 @@ class QueryAnalyzer:
                     'offline_mode': True
                 }
         
-        for pattern in balance_patterns:
-            if re.search(pattern, message_lower):
+        for pattern in _BALANCE_INTENT_RES:
+            if pattern.search(message_lower):
                 return {
                     'intent': 'update_balance', 
                     'confidence': confidence,
@@ -313,8 +532,8 @@ class QueryAnalyzer:
                     'offline_mode': True
                 }
         
-        for pattern in stats_patterns:
-            if re.search(pattern, message_lower):
+        for pattern in _STATS_INTENT_RES:
+            if pattern.search(message_lower):
                 return {
                     'intent': 'view_statistics',
                     'confidence': confidence,
@@ -323,8 +542,7 @@ class QueryAnalyzer:
                 }
         
         # Default to expense if has price pattern
-        price_pattern = r'\d+[k\.]?\d*[k]?'
-        if re.search(price_pattern, message_lower):
+        if _INTENT_PRICE_RE.search(message_lower):
             return {
                 'intent': 'add_expense',
                 'confidence': 0.6,
@@ -372,83 +590,23 @@ class ExpenseExtractor:
         if not _llm_available or not self.llm:
             return self._fallback_extraction(user_message)
         
-        # Create Pydantic parser
-        parser = PydanticOutputParser(pydantic_object=ExpenseInfo)
-        
-        # Enhanced system prompt optimized for Llama3
-        system_prompt = """
-        Bạn là chuyên gia trích xuất thông tin tài chính từ văn bản tiếng Việt.
-        
-        Phân loại transaction_type:
-        - "income": lãnh lương, nhận tiền, thu nhập, được trả, tiền thưởng, tiền lương
-        - "expense": ăn, uống, mua, chi tiêu, trả tiền, mất tiền, tiêu
-        
-        Phân loại account_type (QUAN TRỌNG):
-        - "cash": tiền mặt, cash, tiền lẻ, tiền túi
-        - "account": tài khoản, ngân hàng, chuyển khoản, ck, bank, atm, banking
-        
-        QUAN TRỌNG - Price parsing:
-        - Nếu có "k" ở cuối số: nhân với 1000 (ví dụ: 35k = 35000, 5000k = 5000000)
-        - Nếu không có "k": giữ nguyên số
-        
-        QUAN TRỌNG - Account type keywords:
-        - "ck" = "chuyển khoản" → account_type PHẢI LÀ "account"
-        - "bank" = "ngân hàng" → account_type PHẢI LÀ "account"  
-        - "chuyển khoản" → account_type PHẢI LÀ "account"
-        - "cash" = "tiền mặt" → account_type PHẢI LÀ "cash"
-        
-        {format_instructions}
-        """
-        
-        prompt_template = PromptTemplate(
-            template=system_prompt + "\n\nCâu chat: '{user_message}'\n\nTrích xuất:",
-            input_variables=["user_message"],
-            partial_variables={"format_instructions": parser.get_format_instructions()}
-        )
-        
         try:
-            # Gọi LLM với timeout
-            import signal
-            
-            def timeout_handler(signum, frame):
-                raise TimeoutError("LLM call timeout")
-            
-            signal.signal(signal.SIGALRM, timeout_handler)
+            raw = self.llm.invoke(_build_prompt(_EXPENSE_PROMPT, user_message, "Trích xuất"))
+            response = _EXPENSE_PARSER.parse(raw.content)
             
-            # Timeout khác nhau cho từng provider
-            current_model = get_current_model()
-            model_settings = get_model_settings(current_model)
-            provider = model_settings["provider"]
-            
-            if provider == "ollama":
-                signal.alarm(15)  # 15 giây cho Ollama (model load + inference)
-            else:
-                signal.alarm(5)   # 5 giây cho Google API
+            # Convert Pydantic model to dict with validation
+            result = {
+                'food_item': response.food_item,
+                'price': response.price,
+                'meal_time': response.meal_time,
+                'transaction_type': response.transaction_type,
+                'account_type': response.account_type,
+                'confidence': response.confidence,
+                'offline_mode': False
+            }
             
-            try:
-                # Create chain
-                chain = prompt_template | self.llm | parser
-                
-                # Invoke chain
-                response = chain.invoke({"user_message": user_message})
-                signal.alarm(0)
-                
-                # Convert Pydantic model to dict with validation
-                result = {
-                    'food_item': response.food_item,
-                    'price': response.price,
-                    'meal_time': response.meal_time,
-                    'transaction_type': response.transaction_type,
-                    'account_type': response.account_type,
-                    'confidence': response.confidence,
-                    'offline_mode': False
-                }
-                
-                # Validate and fix result
-                return self._validate_and_fix_llm_result(result, user_message)
-                
-            finally:
-                signal.alarm(0)
+            # Validate and fix result
+            return self._validate_and_fix_llm_result(result, user_message)
             
         except Exception as e:
             error_msg = str(e)
@@ -474,69 +632,21 @@ class ExpenseExtractor:
         if not self.llm:
             return self._fallback_delete_extraction(user_message)
         
-        # Create Pydantic parser
-        parser = PydanticOutputParser(pydantic_object=DeleteInfo)
-        
-        system_prompt = """
-        Bạn là chuyên gia trích xuất thông tin giao dịch cần xóa từ câu chat.
-        
-        Phân tích câu chat và xác định:
-        1. Có phải muốn xóa giao dịch gần nhất không
-        2. Hoặc xóa giao dịch cụ thể (theo tên món, giá, thời gian)
-        
-        Từ khóa xóa gần nhất: "xóa", "gần nhất", "recent", hoặc để trống
-        Từ khóa xóa cụ thể: tên món ăn, giá tiền, thời gian bữa ăn
-        
-        {format_instructions}
-        """
-        
-        prompt_template = PromptTemplate(
-            template=system_prompt + "\n\nCâu chat: '{user_message}'\n\nPhân tích:",
-            input_variables=["user_message"],
-            partial_variables={"format_instructions": parser.get_format_instructions()}
-        )
-        
         try:
-            # Gọi LLM với timeout
-            import signal
-            
-            def timeout_handler(signum, frame):
-                raise TimeoutError("LLM timeout")
-            
-            signal.signal(signal.SIGALRM, timeout_handler)
+            raw = self.llm.invoke(_build_prompt(_DELETE_PROMPT, user_message))
+            response = _DELETE_PARSER.parse(raw.content)
             
-            # Timeout khác nhau cho từng provider
-            current_model = get_current_model()
-            model_settings = get_model_settings(current_model)
-            provider = model_settings["provider"]
-            
-            if provider == "ollama":
-                signal.alarm(15)  # 15 giây cho Ollama
-            else:
-                signal.alarm(5)   # 5 giây cho Google API
+            # Convert to expected format
+            result = {
+                'food_item': response.food_item,
+                'price': response.price,
+                'meal_time': response.meal_time,
+                'delete_recent': response.delete_recent,
+                'confidence': response.confidence,
+                'offline_mode': False
+            }
             
-            try:
-                # Create chain
-                chain = prompt_template | self.llm | parser
-                
-                # Invoke chain  
-                response = chain.invoke({"user_message": user_message})
-                signal.alarm(0)
-                
-                # Convert to expected format
-                result = {
-                    'food_item': response.food_item,
-                    'price': response.price,
-                    'meal_time': response.meal_time,
-                    'delete_recent': response.delete_recent,
-                    'confidence': response.confidence,
-                    'offline_mode': False
-                }
-                
-                return result
-                
-            finally:
-                signal.alarm(0)
+            return result
             
         except Exception as e:
             error_msg = str(e)
@@ -554,41 +664,25 @@ class ExpenseExtractor:
         
         # Loại bỏ các từ khóa xóa để tìm món ăn
         message_clean = message.lower()
-        delete_words = ['xóa', 'xoá', 'hủy', 'bỏ', 'delete', 'remove', 'giao dịch']
-        for word in delete_words:
+        for word in _DELETE_WORDS:
             message_clean = message_clean.replace(word, ' ')
         
         # Tìm giá tiền
-        price_patterns = [r'(\d+)k', r'(\d+)000', r'(\d+)\s*nghìn']
-        for pattern in price_patterns:
-            match = re.search(pattern, message_clean)
-            if match:
-                price_str = match.group(1)
-                if 'k' in pattern or 'nghìn' in pattern:
-                    result['price'] = float(price_str) * 1000
-                else:
-                    result['price'] = float(price_str)
-                break
+        price = _parse_amount(_DELETE_AMOUNT_RE, message_clean)
+        if price:
+            result['price'] = price
         
         # Tìm meal_time
-        meal_patterns = {
-            'sáng': ['sáng', 'buổi sáng'],
-            'trưa': ['trưa', 'buổi trưa'],
-            'chiều': ['chiều', 'buổi chiều'],
-            'tối': ['tối', 'buổi tối']
-        }
-        
-        for meal_time, keywords in meal_patterns.items():
-            if any(keyword in message_clean for keyword in keywords):
+        for meal_time, pattern in _DELETE_MEAL_PATTERNS:
+            if pattern.search(message_clean):
                 result['meal_time'] = meal_time
                 break
         
         # Tìm món ăn (từ còn lại sau khi loại bỏ các từ khóa)
-        food_keywords = ['ăn', 'uống', 'mua']
         words = message_clean.split()
         
         for i, word in enumerate(words):
-            if any(keyword in word for keyword in food_keywords):
+            if _DELETE_FOOD_RE.search(word):
                 if i + 1 < len(words):
                     result['food_item'] = words[i + 1]
                     break
@@ -596,7 +690,7 @@ class ExpenseExtractor:
         if not result['food_item']:
             # Lấy từ có vẻ như món ăn
             for word in words:
-                if len(word) > 2 and word not in ['sáng', 'trưa', 'chiều', 'tối']:
+                if len(word) > 2 and word not in _MEAL_TIME_WORDS:
                     result['food_item'] = word
                     break
         
@@ -616,7 +710,7 @@ class ExpenseExtractor:
             # Nếu price quá nhỏ và message chứa 'k', có thể LLM đã miss đơn vị
             if price < 1000 and ('k' in original_message.lower() or 'K' in original_message):
                 # Tìm số có 'k' trong message
-                price_match = re.search(r'(\d+)k', original_message.lower())
+                price_match = _PRICE_K_RE.search(original_message.lower())
                 if price_match:
                     result['price'] = float(price_match.group(1)) * 1000
                     print(f"🔧 Fixed price: {price} → {result['price']}")
@@ -627,7 +721,7 @@ class ExpenseExtractor:
             # Thử extract từ original message
             words = original_message.split()
             for word in words:
-                if not re.match(r'^\d+[k.]?\d*[k]?$', word.lower()) and word.lower() not in ['ăn', 'uống', 'mua', 'cash', 'bank', 'ck', 'sáng', 'trưa', 'chiều', 'tối']:
+                if not _AMOUNT_WORD_RE.match(word.lower()) and word.lower() not in _NON_FOOD_WORDS:
                     result['food_item'] = word
                     break
             
@@ -638,12 +732,11 @@ class ExpenseExtractor:
         
         # Đảm bảo transaction_type hợp lệ
         transaction_type = result.get('transaction_type', 'expense')
-        if transaction_type not in ['expense', 'income']:
+        if transaction_type not in _VALID_TRANSACTION_TYPES:
             # Phân tích từ original message
             message_lower = original_message.lower()
-            income_keywords = ['lãnh lương', 'nhận tiền', 'thu nhập', 'được trả', 'tiền thưởng', 'lương', 'salary']
             
-            if any(keyword in message_lower for keyword in income_keywords):
+            if _VALIDATE_INCOME_RE.search(message_lower):
                 transaction_type = 'income'
             else:
                 transaction_type = 'expense'
@@ -652,15 +745,13 @@ class ExpenseExtractor:
         
         # Đảm bảo account_type hợp lệ
         account_type = result.get('account_type', 'cash')
-        if account_type not in ['cash', 'account']:
+        if account_type not in _VALID_ACCOUNT_TYPES:
             # Phân tích từ original message  
             message_lower = original_message.lower()
-            account_keywords = ['tài khoản', 'ngân hàng', 'account', 'atm', 'banking', 'chuyển khoản', 'ck', 'bank']
-            cash_keywords = ['tiền mặt', 'cash', 'tiền lẻ', 'tiền túi']
             
-            if any(keyword in message_lower for keyword in account_keywords):
+            if _VALIDATE_ACCOUNT_RE.search(message_lower):
                 account_type = 'account'
-            elif any(keyword in message_lower for keyword in cash_keywords):
+            elif _CASH_RE.search(message_lower):
                 account_type = 'cash'
             else:
                 account_type = 'cash'
@@ -689,105 +780,72 @@ class ExpenseExtractor:
         confidence_boost = 0.0
         
         # Phân tích transaction_type
-        income_keywords = ['lãnh', 'lương', 'nhận', 'thu', 'được', 'thưởng', 'salary', 'income', 'tiền lương']
-        expense_keywords = ['ăn', 'uống', 'mua', 'chi', 'tiêu', 'trả', 'spend']
-        
-        if any(keyword in message_lower for keyword in income_keywords):
+        if _EXPENSE_INCOME_RE.search(message_lower):
             result['transaction_type'] = 'income'
             confidence_boost += 0.1
-        elif any(keyword in message_lower for keyword in expense_keywords):
+        elif _EXPENSE_EXPENSE_RE.search(message_lower):
             result['transaction_type'] = 'expense'
             confidence_boost += 0.1
         
         # Phân tích account_type - Enhanced for llama3 testing
-        account_keywords = ['tài khoản', 'ngân hàng', 'account', 'atm', 'banking', 'chuyển khoản', 'vào tài khoản', 'ck', 'bank']
-        cash_keywords = ['tiền mặt', 'cash', 'tiền lẻ', 'tiền túi']
-        
         # Special handling for "ck" - must be account
-        if 'ck' in message_lower or 'chuyển khoản' in message_lower:
+        if _CK_RE.search(message_lower):
             result['account_type'] = 'account'
             confidence_boost += 0.2  # High confidence for explicit keywords
-        elif any(keyword in message_lower for keyword in account_keywords):
+        elif _EXPENSE_ACCOUNT_RE.search(message_lower):
             result['account_type'] = 'account'
             confidence_boost += 0.1
-        elif any(keyword in message_lower for keyword in cash_keywords):
+        elif _CASH_RE.search(message_lower):
             result['account_type'] = 'cash'
             confidence_boost += 0.1
         
-        # Enhanced price parsing - Fixed for large numbers
-        import re
-        price_patterns = [
-            r'(\d+)k\b',  # 35k, 5000k
-            r'(\d+)000\b',  # 35000
-            r'(\d+)\s*nghìn\b',  # 35 nghìn
-            r'(\d+\.\d+)k\b',  # 35.5k
-        ]
-        
-        for pattern in price_patterns:
-            match = re.search(pattern, message_lower)
-            if match:
-                price_str = match.group(1)
-                if 'k' in pattern or 'nghìn' in pattern:
-                    # Fixed: Always multiply by 1000 for "k" suffix
-                    result['price'] = float(price_str) * 1000
-                else:
-                    result['price'] = float(price_str)
-                confidence_boost += 0.2  # Có giá tiền rõ ràng
-                break
+        # Enhanced price parsing - Fixed for large numbers ("k" luôn nhân 1000)
+        price = _parse_amount(_EXPENSE_AMOUNT_RE, message_lower)
+        if price:
+            result['price'] = price
+            confidence_boost += 0.2  # Có giá tiền rõ ràng
         
         # Tìm meal_time
-        meal_patterns = {
-            'sáng': ['sáng', 'buổi sáng'],
-            'trưa': ['trưa', 'buổi trưa', 'lunch'],
-            'chiều': ['chiều', 'buổi chiều', 'afternoon'],
-            'tối': ['tối', 'buổi tối', 'dinner', 'supper']
-        }
-        
-        for meal_time, keywords in meal_patterns.items():
-            if any(keyword in message_lower for keyword in keywords):
+        for meal_time, pattern in _MEAL_PATTERNS:
+            if pattern.search(message_lower):
                 result['meal_time'] = meal_time
                 confidence_boost += 0.15  # Có thời gian rõ ràng
                 break
         
         # Tìm món ăn/mô tả giao dịch - enhanced logic
-        food_keywords = ['ăn', 'uống', 'mua', 'order', 'gọi']
         words = message.split()
+        words_lower = message_lower.split()  # lower() một lần cho cả câu
+        # Một lượt qua words: Strategy 1 dừng ở hit đầu tiên, đồng thời ghi lại
+        # ứng viên đầu tiên cho Strategy 3 (chỉ dùng nếu Strategy 1/2 không ra)
+        meaningful_word = None
         
         # Strategy 1: Tìm từ ngay sau food keyword
-        for i, word in enumerate(words):
-            word_lower = word.lower()
-            for keyword in food_keywords:
-                if keyword in word_lower and i + 1 < len(words):
-                    potential_food = words[i + 1]
-                    # Loại bỏ số tiền khỏi tên món
-                    potential_food = re.sub(r'\d+k?', '', potential_food).strip()
-                    if potential_food and len(potential_food) > 1:
-                        result['food_item'] = potential_food
-                        confidence_boost += 0.2  # Có món ăn rõ ràng
-                        break
-            if result['food_item']:
-                break
+        for i, word_lower in enumerate(words_lower):
+            if _FOOD_RE.search(word_lower) and i + 1 < len(words):
+                # Loại bỏ số tiền khỏi tên món
+                potential_food = _RE_STRIP_AMT.sub('', words[i + 1]).strip()
+                if potential_food and len(potential_food) > 1:
+                    result['food_item'] = potential_food
+                    confidence_boost += 0.2  # Có món ăn rõ ràng
+                    break
+            if meaningful_word is None:
+                word_clean = _RE_STRIP_AMT.sub('', word_lower).strip()
+                # Loại bỏ các từ thời gian và action
+                if word_clean not in _SKIP_WORDS and len(word_clean) > 2:
+                    meaningful_word = word_clean
         
         # Strategy 2: Tìm mô tả cho giao dịch thu nhập
         if not result['food_item'] and result['transaction_type'] == 'income':
-            income_descriptions = ['lương', 'thưởng', 'thu nhập', 'tiền lương', 'nhận tiền']
-            for desc in income_descriptions:
+            for desc in _INCOME_DESCRIPTIONS:
                 if desc in message_lower:
                     result['food_item'] = desc
                     confidence_boost += 0.15
                     break
         
         # Strategy 3: Nếu chưa tìm được, tìm từ có ý nghĩa
-        if not result['food_item']:
-            for word in words:
-                word_clean = re.sub(r'\d+k?', '', word.lower()).strip()
-                # Loại bỏ các từ thời gian và action
-                skip_words = ['sáng', 'trưa', 'chiều', 'tối', 'ăn', 'uống', 'mua', 'order', 'gọi', 'buổi', 
-                             'lãnh', 'nhận', 'từ', 'vào', 'tài', 'khoản', 'tiền', 'mặt']
-                if word_clean not in skip_words and len(word_clean) > 2:
-                    result['food_item'] = word_clean
-                    confidence_boost += 0.1  # Có từ nhưng không chắc chắn
-                    break
+        if not result['food_item'] and meaningful_word:
+            result['food_item'] = meaningful_word
+            confidence_boost += 0.1  # Có từ nhưng không chắc chắn
         
         # Strategy 4: Fallback - mô tả chung
         if not result['food_item']:
@@ -800,7 +858,7 @@ class ExpenseExtractor:
         final_confidence = result['confidence'] + confidence_boost
         
         # Bonus cho input có format hoàn chỉnh
-        if result['price'] > 0 and result['food_item'] not in ['thu nhập', 'chi tiêu']:
+        if result['price'] > 0 and result['food_item'] not in _GENERIC_DESCRIPTIONS:
             if result['meal_time']:
                 final_confidence += 0.1  # Perfect match: có đủ cả 3 yếu tố
             else:
@@ -818,71 +876,32 @@ class ExpenseExtractor:
         if not _llm_available or not self.llm:
             return self._fallback_balance_update(user_message)
         
-        # Create Pydantic parser
-        parser = PydanticOutputParser(pydantic_object=BalanceUpdate)
-        
-        system_prompt = """
-        Bạn là chuyên gia phân tích câu lệnh cập nhật số dư tài chính.
-        
-        CÓ 2 LOẠI THAO TÁC:
-        1. THIẾT LẬP (SET): Đặt số dư về một giá trị cụ thể
-        2. CỘNG/TRỪ (ADD): Cộng/trừ vào số dư hiện tại
-        
-        PHÂN LOẠI THEO TỪ KHÓA:
-        - SET: "cập nhật lại", "chỉ có", "là", "thành", "đặt lại", "reset"
-        - ADD: "lãnh lương", "nhận tiền", "thu nhập", "chi tiêu", "mất tiền"
-        
-        {format_instructions}
-        """
+        # SET số dư rõ ràng (vd: "tiền mặt chỉ có 500k") thì không cần gọi LLM
+        if _is_unambiguous_balance(user_message.lower()):
+            return self._fallback_balance_update(user_message)
         
-        prompt_template = PromptTemplate(
-            template=system_prompt + "\n\nCâu chat: '{user_message}'\n\nPhân tích:",
-            input_variables=["user_message"],
-            partial_variables={"format_instructions": parser.get_format_instructions()}
-        )
+        cached = _get_cached_response('balance', user_message)
+        if cached is not None:
+            return cached
         
         try:
-            # Gọi LLM với timeout ngắn
-            import signal
-            
-            def timeout_handler(signum, frame):
-                raise TimeoutError("LLM timeout")
-            
-            signal.signal(signal.SIGALRM, timeout_handler)
-            
-            # Timeout khác nhau cho từng provider
-            current_model = get_current_model()
-            model_settings = get_model_settings(current_model)
-            provider = model_settings["provider"]
+            raw = self.llm.invoke(_build_prompt(_BALANCE_PROMPT, user_message))
+            response = _BALANCE_PARSER.parse(raw.content)
             
-            if provider == "ollama":
-                signal.alarm(15)  # 15 giây cho Ollama
+            # Convert to dict format expected by the rest of the system
+            if response.is_balance_update:
+                result = {
+                    'operation_type': response.operation_type,
+                    'cash_balance': response.cash_balance,
+                    'account_balance': response.account_balance,
+                    'cash_amount': response.cash_amount,
+                    'account_amount': response.account_amount,
+                    'description': response.description
+                }
+                _cache_response('balance', user_message, result)
+                return result
             else:
-                signal.alarm(5)   # 5 giây cho Google API
-            
-            try:
-                # Create chain
-                chain = prompt_template | self.llm | parser
-                
-                # Invoke chain
-                response = chain.invoke({"user_message": user_message})
-                signal.alarm(0)
-                
-                # Convert to dict format expected by the rest of the system
-                if response.is_balance_update:
-                    return {
-                        'operation_type': response.operation_type,
-                        'cash_balance': response.cash_balance,
-                        'account_balance': response.account_balance,
-                        'cash_amount': response.cash_amount,
-                        'account_amount': response.account_amount,
-                        'description': response.description
-                    }
-                else:
-                    return None
-                    
-            finally:
-                signal.alarm(0)
+                return None
                 
         except Exception as e:
             error_msg = str(e)
@@ -892,7 +911,7 @@ class ExpenseExtractor:
                 if _llm_available:  # Only show once per session
                     print("⚠️ LLM quota exceeded")
                 _llm_available = False
-            elif "timeout" in error_msg.lower():
+            elif "timeout" in error_msg.lower() or "timed out" in error_msg.lower():
                 # Handle timeout specifically
                 if _llm_available:
                     print("⚠️ LLM timeout - chuyển sang fallback")
@@ -907,42 +926,22 @@ class ExpenseExtractor:
         message_lower = message.lower()
         
         # Kiểm tra có phải balance update không
-        balance_keywords = ['cập nhật', 'update', 'tiền mặt', 'tài khoản', 'lãnh lương', 'nhận tiền', 'chi tiêu']
-        if not any(keyword in message_lower for keyword in balance_keywords):
+        if not _BALANCE_GATE_RE.search(message_lower):
             return None
         
         # Phân loại operation type
-        set_keywords = ['cập nhật lại', 'chỉ có', 'là', 'thành', 'đặt lại', 'reset', 'thiết lập']
-        add_keywords = ['lãnh', 'lương', 'nhận', 'thu', 'được', 'thưởng', 'chi', 'tiêu', 'mất', 'trả']
-        
-        is_set_operation = any(keyword in message_lower for keyword in set_keywords)
-        is_add_operation = any(keyword in message_lower for keyword in add_keywords)
+        is_set_operation = bool(_BALANCE_SET_RE.search(message_lower))
+        is_add_operation = bool(_BALANCE_ADD_RE.search(message_lower))
         
         # Tìm số tiền
-        import re
-        amount = 0
-        price_patterns = [r'(\d+)k\b', r'(\d+)000\b', r'(\d+)\s*nghìn\b', r'(\d+)\s*triệu\b']
-        for pattern in price_patterns:
-            match = re.search(pattern, message_lower)
-            if match:
-                amount_str = match.group(1)
-                if 'triệu' in pattern:
-                    amount = float(amount_str) * 1000000
-                elif 'k' in pattern or 'nghìn' in pattern:
-                    amount = float(amount_str) * 1000
-                else:
-                    amount = float(amount_str)
-                break
+        amount = _parse_balance_amount(message_lower)
         
         if amount <= 0:
             return None
         
         # Xác định loại tài khoản
-        account_keywords = ['tài khoản', 'ngân hàng', 'account', 'atm', 'vào tài khoản']
-        cash_keywords = ['tiền mặt', 'cash', 'tiền lẻ', 'tiền túi']
-        
-        is_account = any(keyword in message_lower for keyword in account_keywords)
-        is_cash = any(keyword in message_lower for keyword in cash_keywords)
+        is_account = bool(_BALANCE_ACCOUNT_RE.search(message_lower))
+        is_cash = bool(_CASH_RE.search(message_lower))
         
         balance_update = {}
         
@@ -958,11 +957,8 @@ class ExpenseExtractor:
         else:
             # Cộng/trừ số dư (ADD)
             # Xác định cộng hay trừ
-            income_keywords = ['lãnh', 'lương', 'nhận', 'thu', 'được', 'thưởng', 'cập nhật', 'còn', 'có']
-            expense_keywords = ['chi', 'tiêu', 'mất', 'trả', 'spend']
-            
-            is_income = any(keyword in message_lower for keyword in income_keywords)
-            is_expense = any(keyword in message_lower for keyword in expense_keywords)
+            is_income = bool(_BALANCE_INCOME_RE.search(message_lower))
+            is_expense = bool(_BALANCE_EXPENSE_RE.search(message_lower))
             
             if is_expense and not is_income:
                 amount = -amount  # Chi tiêu thì âm
@@ -986,69 +982,31 @@ class ExpenseExtractor:
         if not self.llm:
             return self._fallback_statistics_extraction(user_message)
         
-        # Create Pydantic parser
-        parser = PydanticOutputParser(pydantic_object=StatisticsInfo)
-        
-        system_prompt = """
-        Bạn là chuyên gia trích xuất thông tin yêu cầu thống kê chi tiêu.
-        
-        Phân tích câu chat và xác định:
-        1. Khoảng thời gian thống kê: daily, weekly, monthly
-        2. Ngày cụ thể nếu có (định dạng YYYY-MM-DD)
-        
-        Từ khóa nhận biết:
-        - "hôm nay", "today" → daily
-        - "tuần", "week" → weekly  
-        - "tháng", "month" → monthly
-        
-        {format_instructions}
-        """
+        # Khoảng thời gian rõ ràng và không có ngày cụ thể thì rule-based là đủ
+        message_lower = user_message.lower().strip()
+        if _stats_period(message_lower)[1] >= 0.8 and not any(c.isdigit() for c in message_lower):
+            result = self._fallback_statistics_extraction(user_message)
+            result['offline_mode'] = False
+            return result
         
-        prompt_template = PromptTemplate(
-            template=system_prompt + "\n\nCâu chat: '{user_message}'\n\nPhân tích:",
-            input_variables=["user_message"],
-            partial_variables={"format_instructions": parser.get_format_instructions()}
-        )
+        cached = _get_cached_response('statistics', user_message)
+        if cached is not None:
+            return cached
         
         try:
-            # Gọi LLM với timeout
-            import signal
-            
-            def timeout_handler(signum, frame):
-                raise TimeoutError("LLM timeout")
-            
-            signal.signal(signal.SIGALRM, timeout_handler)
+            raw = self.llm.invoke(_build_prompt(_STATISTICS_PROMPT, user_message))
+            response = _STATISTICS_PARSER.parse(raw.content)
             
-            # Timeout khác nhau cho từng provider
-            current_model = get_current_model()
-            model_settings = get_model_settings(current_model)
-            provider = model_settings["provider"]
-            
-            if provider == "ollama":
-                signal.alarm(15)  # 15 giây cho Ollama
-            else:
-                signal.alarm(5)   # 5 giây cho Google API
+            # Convert to expected format
+            result = {
+                'period': response.period,
+                'specific_date': response.specific_date,
+                'confidence': response.confidence,
+                'offline_mode': False
+            }
             
-            try:
-                # Create chain
-                chain = prompt_template | self.llm | parser
-                
-                # Invoke chain
-                response = chain.invoke({"user_message": user_message})
-                signal.alarm(0)
-                
-                # Convert to expected format
-                result = {
-                    'period': response.period,
-                    'specific_date': response.specific_date,
-                    'confidence': response.confidence,
-                    'offline_mode': False
-                }
-                
-                return result
-                
-            finally:
-                signal.alarm(0)
+            _cache_response('statistics', user_message, result)
+            return result
             
         except Exception as e:
             error_msg = str(e)
@@ -1059,19 +1017,8 @@ class ExpenseExtractor:
         """Rule-based fallback cho statistics extraction"""
         message_lower = message.lower().strip()
         
-        # Detect period
-        if any(word in message_lower for word in ['hôm nay', 'today', 'daily']):
-            period = 'daily'
-            confidence = 0.8
-        elif any(word in message_lower for word in ['tuần', 'week', 'weekly']):
-            period = 'weekly' 
-            confidence = 0.8
-        elif any(word in message_lower for word in ['tháng', 'month', 'monthly']):
-            period = 'monthly'
-            confidence = 0.8
-        else:
-            period = 'daily'  # Default
-            confidence = 0.5
+        # Detect period (cached - CLI -sd/-sw/-sm lặp lại cùng vài câu)
+        period, confidence = _stats_period(message_lower)
         
         return {
             'period': period,
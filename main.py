@@ -8,27 +8,256 @@ Usage:
   python main.py -sd                      # Statistics daily
   python main.py -sw                      # Statistics weekly  
   python main.py -sm                      # Statistics monthly
+  python main.py -sm --full               # Monthly + 30-day detail/chart, no prompt
+  python main.py --daemon                 # Keep a tracker running for fast -a/-d
 """
 
 import sys
 import os
+import json
+import time
+import shutil
+import hashlib
+import select
 import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional
 from rich.console import Console
 from rich.panel import Panel
 from rich.table import Table
 from rich import box
-from chatbot import ExpenseChatbot
-from expense_tracker import ExpenseTracker
 import datetime
 from config import set_current_model, get_current_model, list_available_models
 
 
-def create_parser():
-    """Tạo argument parser cho CLI"""
-    parser = argparse.ArgumentParser(
-        description="🤖 Expense Tracker Assistant",
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""
+# period -> (thông báo, nhãn thời gian, tiêu đề panel)
+_PERIOD_CONFIG = {
+    'daily': ("🔍 Lấy thống kê hôm nay...", "HÔM NAY", "📊 THỐNG KÊ HÔM NAY"),
+    'weekly': ("📅 Lấy thống kê tuần...", "7 NGÀY QUA", "📊 THỐNG KÊ TUẦN"),
+    'monthly': ("📅 Lấy thống kê tháng...", "30 NGÀY QUA", "📊 THỐNG KÊ THÁNG"),
+}
+
+# Cột bảng: (tiêu đề, kwargs cho add_column) - dựng sẵn một lần
+_OVERVIEW_COLUMNS = (
+    ("📅 Thống kê", {"style": "cyan"}),
+    ("Giá trị", {"style": "green", "justify": "right"}),
+)
+_DAY_COLUMNS = (
+    ("Ngày", {"style": "cyan"}),
+    ("Chi tiêu", {"style": "red", "justify": "right"}),
+    ("Thu nhập", {"style": "green", "justify": "right"}),
+)
+_DETAIL_TABLE_STYLE = {"show_header": True, "header_style": "bold magenta", "box": box.SIMPLE}
+_BALANCE_PANEL_STYLE = {"title": "💰 SỐ DƯ HIỆN TẠI", "padding": (1, 3)}
+# Định dạng tiền VNĐ: 1500000 -> "1,500,000đ" (format spec dựng sẵn một lần)
+_fmt_vnd = "{:,.0f}đ".format
+# Tên thứ viết tắt giống strftime('%a') ở locale mặc định
+_WEEKDAY_ABBR = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+# Biểu tượng cột "Loại": (transaction_type, account_type) -> thu/chi + tiền mặt/tài khoản
+_TRANSACTION_GLYPHS = {
+    ('income', 'account'): "💰🏦",
+    ('income', 'cash'): "💰💵",
+    ('expense', 'account'): "💸🏦",
+    ('expense', 'cash'): "💸💵",
+}
+_DEFAULT_TRANSACTION_GLYPH = "💸💵"  # Giá trị lạ: chi tiêu/tiền mặt
+# Tên tháng tiếng Việt, index theo số tháng (index 0 không dùng)
+_MONTH_VN = tuple(f"Tháng {i}" for i in range(13))
+
+
+def _parse_iso_date(date_str: str) -> datetime.date:
+    """'YYYY-MM-DD' -> date, cắt chuỗi trực tiếp thay vì strptime"""
+    return datetime.date(int(date_str[:4]), int(date_str[5:7]), int(date_str[8:10]))
+
+
+def _short_date(date_str: str) -> str:
+    """'YYYY-MM-DD' -> 'DD/MM'"""
+    return f"{date_str[8:10]}/{date_str[5:7]}"
+
+
+def _day_label(date_str: str) -> str:
+    """'YYYY-MM-DD' -> 'DD/MM (Mon)'"""
+    return f"{_short_date(date_str)} ({_WEEKDAY_ABBR[_parse_iso_date(date_str).weekday()]})"
+
+
+# Biểu đồ tháng đã vẽ: {tên file: hash dữ liệu} - dữ liệu không đổi thì không vẽ lại
+_CHART_CACHE_FILE = os.path.join("expense_charts", ".cache.json")
+_CHART_CACHE_MAX_AGE = 7 * 24 * 3600  # giây
+
+
+def _chart_data_key(monthly_data) -> str:
+    """Hash ngắn của dữ liệu biểu đồ"""
+    return hashlib.blake2b(repr(monthly_data).encode(), digest_size=8).hexdigest()
+
+
+def _load_chart_cache() -> dict:
+    try:
+        with open(_CHART_CACHE_FILE, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _is_chart_current(chart_path: str, data_key: str) -> bool:
+    """Biểu đồ đã có, chưa quá 7 ngày và vẽ từ đúng dữ liệu này"""
+    try:
+        if time.time() - os.path.getmtime(chart_path) > _CHART_CACHE_MAX_AGE:
+            return False
+    except OSError:
+        return False
+    return _load_chart_cache().get(os.path.basename(chart_path)) == data_key
+
+
+def _remember_chart(chart_path: str, data_key: str):
+    cache = _load_chart_cache()
+    cache[os.path.basename(chart_path)] = data_key
+    try:
+        with open(_CHART_CACHE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+    except OSError:
+        pass  # Không lưu được cache thì lần sau vẽ lại
+
+
+# Lệnh mở file bằng ứng dụng mặc định theo hệ điều hành (Windows dùng os.startfile).
+# Tìm đường dẫn một lần lúc import; "" nghĩa là máy không có lệnh này
+_USE_STARTFILE = sys.platform == 'win32'
+_FILE_OPENER = "" if _USE_STARTFILE else (shutil.which('open' if sys.platform == 'darwin' else 'xdg-open') or "")
+
+
+def _open_file(path: str) -> bool:
+    """Mở file bằng viewer mặc định, không chờ viewer đóng"""
+    try:
+        if _USE_STARTFILE:
+            os.startfile(path)
+        elif _FILE_OPENER:
+            # Tách session riêng: CLI thoát ngay, viewer không bị kill theo terminal
+            subprocess.Popen(
+                [_FILE_OPENER, path],
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                start_new_session=True
+            )
+        else:
+            return False
+        return True
+    except OSError:
+        return False
+
+
+def _format_vnd_tick(value, _pos) -> str:
+    """Nhãn trục y cho biểu đồ: 1,500,000đ"""
+    return _fmt_vnd(value)
+
+
+def _make_table(columns, **table_kwargs) -> Table:
+    """Tạo Table với các cột định nghĩa sẵn"""
+    table = Table(**table_kwargs)
+    for header, column_kwargs in columns:
+        table.add_column(header, **column_kwargs)
+    return table
+
+
+def _quick_stats_table(color: str) -> Table:
+    """Bảng 2 cột không header cho thống kê nhanh sau khi thêm/xóa"""
+    return _make_table(
+        (("", {"style": color, "width": 20}), ("", {"style": "yellow", "justify": "right", "width": 15})),
+        show_header=False, box=box.SIMPLE, border_style=color
+    )
+
+
+def _overview_table(summary: dict, time_label: str) -> Table:
+    """Bảng tổng quan: thời gian, tổng chi, số giao dịch, trung bình"""
+    stats_table = _make_table(_OVERVIEW_COLUMNS, box=box.DOUBLE_EDGE)
+    stats_table.add_row("📅 Thời gian", time_label)
+    stats_table.add_row("💸 Tổng chi tiêu", _fmt_vnd(summary['total_spent']) if summary['total_spent'] else "0đ")
+    stats_table.add_row("🔢 Số giao dịch", f"{summary['transaction_count']} lần")
+    
+    if summary['transaction_count'] > 0:
+        avg = summary['total_spent'] / summary['transaction_count']
+        stats_table.add_row("📊 Trung bình/lần", _fmt_vnd(avg))
+    return stats_table
+
+
+def _balance_panel(balance: dict) -> Panel:
+    """Panel số dư hiện tại"""
+    balance_content = f"""💵 Tiền mặt                 {_fmt_vnd(balance['cash_balance'])}
+🏦 Tài khoản                {_fmt_vnd(balance['account_balance'])}
+💰 Tổng cộng                {_fmt_vnd(balance['cash_balance'] + balance['account_balance'])}"""
+    return Panel(balance_content, **_BALANCE_PANEL_STYLE)
+
+
+# Thời gian chờ trả lời câu hỏi y/n trước khi coi như "không" (giây)
+_PROMPT_TIMEOUT = 10.0
+
+
+def _prompt(message: str, timeout: float = _PROMPT_TIMEOUT) -> str:
+    """input() có timeout khi stdin không phải terminal - chạy không có người (cron/script) không bị treo
+    
+    Ở terminal thì chờ người dùng như input(). Hết thời gian thì raise EOFError như khi stdin đóng.
+    """
+    print(message, end='', flush=True)
+    # select trên stdin chỉ hỗ trợ ở POSIX; Windows dùng input() thường
+    if os.name == 'posix' and not sys.stdin.isatty():
+        ready, _, _ = select.select([sys.stdin], [], [], timeout)
+        if not ready:
+            print(f"\n⏱️ Không có trả lời sau {timeout:.0f} giây")
+            raise EOFError
+    line = sys.stdin.readline()
+    if not line:
+        raise EOFError
+    return line
+
+
+@lru_cache(maxsize=1)
+def _console() -> Console:
+    """Console dùng chung cho cả lần chạy CLI"""
+    return Console()
+
+
+@lru_cache(maxsize=1)
+def _plotting():
+    """(pyplot, matplotlib.dates, numpy) - import matplotlib một lần (~200-400ms lần đầu)"""
+    import matplotlib
+    matplotlib.use('Agg')  # Backend không cần GUI, chỉ để save file
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    import numpy as np  # đi kèm matplotlib
+    return plt, mdates, np
+
+
+def _prewarm_plotting():
+    """Import matplotlib ở background trong lúc query DB cho -sm"""
+    def _load():
+        try:
+            _plotting()
+        except ImportError:
+            pass  # show_monthly_chart sẽ báo thiếu matplotlib
+    
+    threading.Thread(target=_load, daemon=True).start()
+
+
+@lru_cache(maxsize=1)
+def _tracker():
+    """ExpenseTracker dùng chung - chỉ mở DB/khởi tạo LLM một lần"""
+    # Import muộn: --llm không cần kéo theo LLM stack
+    from expense_tracker import ExpenseTracker
+    return ExpenseTracker()
+
+
+def _process_message(text: str) -> dict:
+    """Xử lý tin nhắn qua daemon nếu đang chạy, không thì dùng tracker trong process"""
+    from expense_daemon import send_message
+    
+    result = send_message(text)
+    if result is None:
+        # Chỉ khi không kết nối được daemon - đã gửi mà lỗi thì không chạy lại (tránh ghi trùng)
+        result = _tracker().process_user_message(text)
+    return result
+
+
+_PARSER_EPILOG = """
 Examples:
   %(prog)s                              # Interactive mode
   %(prog)s -a "trưa ăn phở 30k"         # Quick add expense
@@ -39,58 +268,68 @@ Examples:
   %(prog)s -sd                          # Today's statistics
   %(prog)s -sw                          # This week's statistics
   %(prog)s -sm                          # This month's statistics
+  %(prog)s -sm --full                   # ... with 30-day detail + chart, no prompt
         """
-    )
-    
+
+# Định nghĩa CLI: (mutually exclusive?, ((flags, kwargs cho add_argument), ...))
+_PARSER_SPEC = (
     # Quick operations group
-    group = parser.add_mutually_exclusive_group()
-    
-    group.add_argument(
-        '-a', '--append',
-        metavar='EXPENSE',
-        help='Quickly add an expense (e.g., "trưa ăn phở 30k")'
-    )
-    
-    group.add_argument(
-        '-d', '--delete',
-        metavar='DELETE_QUERY',
-        nargs='?',  # Make argument optional
-        const='xóa',  # Default value when -d is used without argument
-        help='Quickly delete a transaction (e.g., "xóa phở", "xóa phở 30k", or just -d to delete most recent)'
-    )
-    
-    group.add_argument(
-        '-sd', '--stats-daily',
-        action='store_true',
-        help='Show today\'s spending statistics'
-    )
-    
-    group.add_argument(
-        '-sw', '--stats-weekly', 
-        action='store_true',
-        help='Show this week\'s spending statistics'
-    )
-    
-    group.add_argument(
-        '-sm', '--stats-monthly',
-        action='store_true', 
-        help='Show this month\'s spending statistics'
-    )
-    
+    (True, (
+        (('-a', '--append'), {
+            'metavar': 'EXPENSE',
+            'help': 'Quickly add an expense (e.g., "trưa ăn phở 30k")',
+        }),
+        (('-d', '--delete'), {
+            'metavar': 'DELETE_QUERY',
+            'nargs': '?',  # Make argument optional
+            'const': 'xóa',  # Default value when -d is used without argument
+            'help': 'Quickly delete a transaction (e.g., "xóa phở", "xóa phở 30k", or just -d to delete most recent)',
+        }),
+        (('-sd', '--stats-daily'), {'action': 'store_true', 'help': 'Show today\'s spending statistics'}),
+        (('-sw', '--stats-weekly'), {'action': 'store_true', 'help': 'Show this week\'s spending statistics'}),
+        (('-sm', '--stats-monthly'), {'action': 'store_true', 'help': 'Show this month\'s spending statistics'}),
+    )),
     # LLM configuration option - không thuộc mutually exclusive group
-    parser.add_argument(
-        '--llm',
-        metavar='MODEL_NAME',
-        help='Set LLM model (gemini, llama3, phi3) and save for future use'
+    (False, (
+        (('--llm',), {
+            'metavar': 'MODEL_NAME',
+            'help': 'Set LLM model (gemini, llama3, phi3) and save for future use',
+        }),
+    )),
+    # Tùy chọn cho -sm: xem/bỏ qua chi tiết 30 ngày + biểu đồ mà không cần hỏi
+    (True, (
+        (('--full',), {'action': 'store_true', 'help': 'With -sm: show the 30-day detail and chart without asking'}),
+        (('--no-chart',), {'action': 'store_true', 'help': 'With -sm: skip the 30-day detail and chart without asking'}),
+    )),
+    (False, (
+        (('--png',), {'action': 'store_true', 'help': 'With -sm: save the chart as PNG instead of SVG'}),
+    )),
+    (False, (
+        (('--daemon',), {'action': 'store_true', 'help': 'Run a background tracker so -a/-d skip start-up (Unix only)'}),
+    )),
+)
+
+
+@lru_cache(maxsize=1)
+def create_parser():
+    """Tạo argument parser cho CLI (dựng một lần - parse_args không đổi trạng thái parser)"""
+    parser = argparse.ArgumentParser(
+        description="🤖 Expense Tracker Assistant",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=_PARSER_EPILOG
     )
     
+    for exclusive, arguments in _PARSER_SPEC:
+        target = parser.add_mutually_exclusive_group() if exclusive else parser
+        for flags, kwargs in arguments:
+            target.add_argument(*flags, **kwargs)
+    
     return parser
 
 
 def quick_delete_transaction(delete_query: str):
     """Xóa transaction nhanh từ command line"""
-    console = Console()
-    tracker = ExpenseTracker()
+    console = _console()
     
     # Xử lý trường hợp empty string hoặc chỉ có whitespace
     if not delete_query.strip():
@@ -100,7 +339,7 @@ def quick_delete_transaction(delete_query: str):
         console.print(f"[yellow]🗑️ Đang xóa: {delete_query}[/yellow]")
     
     # Process the delete request
-    result = tracker.process_user_message(delete_query)
+    result = _process_message(delete_query)
     
     if result['success']:
         # Show success message
@@ -111,20 +350,18 @@ def quick_delete_transaction(delete_query: str):
         if 'statistics' in result:
             stats = result['statistics']
             
-            stats_table = Table(show_header=False, box=box.SIMPLE, border_style="red")
-            stats_table.add_column("", style="red", width=20)
-            stats_table.add_column("", style="yellow", justify="right", width=15)
+            stats_table = _quick_stats_table("red")
             
-            stats_table.add_row("🗑️ Đã xóa", f"{stats['deleted_amount']:,.0f}đ")
-            stats_table.add_row("📅 Hôm nay còn", f"{stats['today_total']:,.0f}đ ({stats['today_count']} lần)")
-            stats_table.add_row("📆 Tuần này còn", f"{stats['week_total']:,.0f}đ ({stats['week_count']} lần)")
+            stats_table.add_row("🗑️ Đã xóa", _fmt_vnd(stats['deleted_amount']))
+            stats_table.add_row("📅 Hôm nay còn", f"{_fmt_vnd(stats['today_total'])} ({stats['today_count']} lần)")
+            stats_table.add_row("📆 Tuần này còn", f"{_fmt_vnd(stats['week_total'])} ({stats['week_count']} lần)")
             
             console.print(Panel(stats_table, title="🗑️ Thống kê sau khi xóa", border_style="red"))
         
         # Show deleted transaction info if available
         if 'deleted_transaction' in result:
             deleted = result['deleted_transaction']
-            console.print(f"[dim]🗑️ Đã xóa: {deleted['food_item']} - {deleted['price']:,.0f}đ ({deleted.get('meal_time', 'N/A')})[/dim]")
+            console.print(f"[dim]🗑️ Đã xóa: {deleted['food_item']} - {_fmt_vnd(deleted['price'])} ({deleted.get('meal_time', 'N/A')})[/dim]")
         
         # Show sync/note info
         if result.get('note'):
@@ -145,13 +382,12 @@ def quick_delete_transaction(delete_query: str):
 
 def quick_add_expense(expense_text: str):
     """Thêm expense nhanh từ command line"""
-    console = Console()
-    tracker = ExpenseTracker()
+    console = _console()
     
     console.print(f"[yellow]🔄 Đang thêm: {expense_text}[/yellow]")
     
     # Process the expense
-    result = tracker.process_user_message(expense_text)
+    result = _process_message(expense_text)
     
     if result['success']:
         # Show success message
@@ -164,13 +400,11 @@ def quick_add_expense(expense_text: str):
         if 'statistics' in result:
             stats = result['statistics']
             
-            stats_table = Table(show_header=False, box=box.SIMPLE, border_style="cyan")
-            stats_table.add_column("", style="cyan", width=20)
-            stats_table.add_column("", style="yellow", justify="right", width=15)
+            stats_table = _quick_stats_table("cyan")
             
-            stats_table.add_row("🎯 Giao dịch này", f"{stats['this_transaction']:,.0f}đ")
-            stats_table.add_row("📅 Hôm nay", f"{stats['today_total']:,.0f}đ ({stats['today_count']} lần)")
-            stats_table.add_row("📆 Tuần này", f"{stats['week_total']:,.0f}đ ({stats['week_count']} lần)")
+            stats_table.add_row("🎯 Giao dịch này", _fmt_vnd(stats['this_transaction']))
+            stats_table.add_row("📅 Hôm nay", f"{_fmt_vnd(stats['today_total'])} ({stats['today_count']} lần)")
+            stats_table.add_row("📆 Tuần này", f"{_fmt_vnd(stats['week_total'])} ({stats['week_count']} lần)")
             
             console.print(Panel(stats_table, title="📊 Thống kê nhanh", border_style="cyan"))
         
@@ -191,353 +425,284 @@ def quick_add_expense(expense_text: str):
             console.print("[red]🔴 Chế độ offline - Vui lòng nhập rõ ràng hơn[/red]")
 
 
-def show_statistics(period: str):
-    """Hiển thị thống kê theo thời gian với giao diện cải tiến"""
-    from rich.console import Console
-    from rich.panel import Panel
-    from rich.table import Table
-    from rich import box
+def show_statistics(period: str, full: Optional[bool] = None, chart_format: str = "svg"):
+    """Hiển thị thống kê theo thời gian với giao diện cải tiến
     
-    console = Console()
+    full: (monthly) True/False để bật/tắt chi tiết 30 ngày + biểu đồ, None thì hỏi
+    chart_format: (monthly) "svg" hoặc "png" cho file biểu đồ
+    """
+    console = _console()
+    # Lấy thời gian một lần cho cả lần hiển thị - tiêu đề không lệch nếu chạy qua nửa đêm
+    now = datetime.datetime.now()
     
     try:
-        tracker = ExpenseTracker()
-        balance = tracker.db.get_user_balance()
+        tracker = _tracker()
+        loading_message, time_label, stats_title = _PERIOD_CONFIG[period]
+        console.print(loading_message)
+        
+        # Số dư, tổng kết và dữ liệu chi tiết lấy trong một connection
+        bundle = tracker.db.get_stats_bundle(period)
+        balance = bundle['balance']
+        summary = bundle['summary']
         
         if period == "daily":
-            console.print("🔍 Lấy thống kê hôm nay...")
-            
-            # Lấy tổng thống kê ngày
-            summary = tracker.db.get_spending_summary(1, 1)
-            
-            # Lấy TẤT CẢ giao dịch trong ngày
-            daily_transactions = tracker.db.get_daily_transactions()
+            # TẤT CẢ giao dịch trong ngày
+            daily_transactions = bundle['details']
             
             # Tạo bảng thống kê tổng quan
-            stats_table = Table(box=box.DOUBLE_EDGE)
-            stats_table.add_column("📅 Thống kê", style="cyan")
-            stats_table.add_column("Giá trị", style="green", justify="right")
-            
-            stats_table.add_row("📅 Thời gian", "HÔM NAY")
-            stats_table.add_row("💸 Tổng chi tiêu", f"{summary['total_spent']:,.0f}đ" if summary['total_spent'] else "0đ")
-            stats_table.add_row("🔢 Số giao dịch", f"{summary['transaction_count']} lần")
+            stats_table = _overview_table(summary, time_label)
             
             if summary['transaction_count'] > 0:
-                avg = summary['total_spent'] / summary['transaction_count']
-                stats_table.add_row("📊 Trung bình/lần", f"{avg:,.0f}đ")
-                stats_table.add_row("📉 Thấp nhất", f"{summary['min_spent']:,.0f}đ")
-                stats_table.add_row("📈 Cao nhất", f"{summary['max_spent']:,.0f}đ")
-            
-            console.print(Panel(stats_table, title="📊 THỐNG KÊ HÔM NAY", padding=(1, 2)))
-            
-            # Hiển thị số dư
-            balance_content = f"""💵 Tiền mặt                 {balance['cash_balance']:,.0f}đ
-🏦 Tài khoản                {balance['account_balance']:,.0f}đ
-💰 Tổng cộng                {balance['cash_balance'] + balance['account_balance']:,.0f}đ"""
+                stats_table.add_row("📉 Thấp nhất", _fmt_vnd(summary['min_spent']))
+                stats_table.add_row("📈 Cao nhất", _fmt_vnd(summary['max_spent']))
             
-            console.print(Panel(balance_content, title="💰 SỐ DƯ HIỆN TẠI", padding=(1, 3)))
-            
-            # Hiển thị TẤT CẢ giao dịch trong ngày
-            if daily_transactions:
-                transaction_table = Table(show_header=True, header_style="bold magenta", box=box.SIMPLE)
-                transaction_table.add_column("Thời gian", style="dim")
-                transaction_table.add_column("Món", style="cyan")
-                transaction_table.add_column("Giá", style="green", justify="right")
-                transaction_table.add_column("Bữa", style="yellow")
-                transaction_table.add_column("Loại", style="blue")
+            with console:  # Gom output, ghi ra stdout một lần
+                console.print(Panel(stats_table, title=stats_title, padding=(1, 2)))
                 
-                for trans in daily_transactions:
-                    meal_time = trans['meal_time'] if trans['meal_time'] else ""
-                    trans_type = "💰" if trans['transaction_type'] == 'income' else "💸"
-                    account_type = "🏦" if trans['account_type'] == 'account' else "💵"
-                    
-                    transaction_table.add_row(
-                        trans['transaction_time'][:5] if trans['transaction_time'] else "",  # HH:MM
-                        trans['food_item'],
-                        f"{trans['price']:,.0f}đ",
-                        meal_time,
-                        f"{trans_type}{account_type}"
-                    )
+                # Hiển thị số dư
+                console.print(_balance_panel(balance))
                 
-                console.print(Panel(transaction_table, title="🕐 TẤT CẢ GIAO DỊCH HÔM NAY", padding=(1, 2)))
-            else:
-                console.print(Panel("Chưa có giao dịch nào hôm nay", title="🕐 GIAO DỊCH HÔM NAY", padding=(1, 2)))
+                # Hiển thị TẤT CẢ giao dịch trong ngày
+                if daily_transactions:
+                    transaction_table = Table(**_DETAIL_TABLE_STYLE)
+                    transaction_table.add_column("Thời gian", style="dim")
+                    transaction_table.add_column("Món", style="cyan")
+                    transaction_table.add_column("Giá", style="green", justify="right")
+                    transaction_table.add_column("Bữa", style="yellow")
+                    transaction_table.add_column("Loại", style="blue")
+                    
+                    for trans in daily_transactions:
+                        meal_time = trans['meal_time'] if trans['meal_time'] else ""
+                        
+                        transaction_table.add_row(
+                            trans['transaction_time'][:5] if trans['transaction_time'] else "",  # HH:MM
+                            trans['food_item'],
+                            _fmt_vnd(trans['price']),
+                            meal_time,
+                            _TRANSACTION_GLYPHS.get((trans['transaction_type'], trans['account_type']), _DEFAULT_TRANSACTION_GLYPH)
+                        )
+                    
+                    console.print(Panel(transaction_table, title="🕐 TẤT CẢ GIAO DỊCH HÔM NAY", padding=(1, 2)))
+                else:
+                    console.print(Panel("Chưa có giao dịch nào hôm nay", title="🕐 GIAO DỊCH HÔM NAY", padding=(1, 2)))
                 
         elif period == "weekly":
-            console.print("📅 Lấy thống kê tuần...")
-            
-            # Lấy tổng thống kê tuần
-            summary = tracker.db.get_spending_summary(1, 7)
-            weekly_data = tracker.db.get_weekly_summary_by_days(1, 7)
+            weekly_data = bundle['details']
             
             # Bảng tổng quan
-            stats_table = Table(box=box.DOUBLE_EDGE)
-            stats_table.add_column("📅 Thống kê", style="cyan")
-            stats_table.add_column("Giá trị", style="green", justify="right")
+            stats_table = _overview_table(summary, time_label)
             
-            stats_table.add_row("📅 Thời gian", "7 NGÀY QUA")
-            stats_table.add_row("💸 Tổng chi tiêu", f"{summary['total_spent']:,.0f}đ" if summary['total_spent'] else "0đ")
-            stats_table.add_row("🔢 Số giao dịch", f"{summary['transaction_count']} lần")
-            
-            if summary['transaction_count'] > 0:
-                avg = summary['total_spent'] / summary['transaction_count']
-                stats_table.add_row("📊 Trung bình/lần", f"{avg:,.0f}đ")
-            
-            console.print(Panel(stats_table, title="📊 THỐNG KÊ TUẦN", padding=(1, 2)))
-            
-            # Bảng chi tiết theo từng ngày
-            daily_table = Table(show_header=True, header_style="bold magenta", box=box.SIMPLE)
-            daily_table.add_column("Ngày", style="cyan")
-            daily_table.add_column("Chi tiêu", style="red", justify="right")
-            daily_table.add_column("Thu nhập", style="green", justify="right")
-            daily_table.add_column("Giao dịch", style="blue", justify="center")
-            
-            for day_data in weekly_data:
-                date_obj = datetime.datetime.strptime(day_data['date'], '%Y-%m-%d')
-                date_display = date_obj.strftime('%d/%m (%a)')
+            with console:  # Gom output, ghi ra stdout một lần
+                console.print(Panel(stats_table, title=stats_title, padding=(1, 2)))
                 
-                daily_table.add_row(
-                    date_display,
-                    f"{day_data['total_expense']:,.0f}đ" if day_data['total_expense'] > 0 else "-",
-                    f"{day_data['total_income']:,.0f}đ" if day_data['total_income'] > 0 else "-",
-                    f"{day_data['transaction_count']} lần"
-                )
-            
-            console.print(Panel(daily_table, title="📈 CHI TIẾT THEO NGÀY", padding=(1, 2)))
-            
-            # Hiển thị số dư
-            balance_content = f"""💵 Tiền mặt                 {balance['cash_balance']:,.0f}đ
-🏦 Tài khoản                {balance['account_balance']:,.0f}đ
-💰 Tổng cộng                {balance['cash_balance'] + balance['account_balance']:,.0f}đ"""
-            
-            console.print(Panel(balance_content, title="💰 SỐ DƯ HIỆN TẠI", padding=(1, 3)))
+                # Bảng chi tiết theo từng ngày
+                daily_table = _make_table(_DAY_COLUMNS, **_DETAIL_TABLE_STYLE)
+                daily_table.add_column("Giao dịch", style="blue", justify="center")
+                
+                for day_data in weekly_data:
+                    daily_table.add_row(
+                        _day_label(day_data['date']),
+                        _fmt_vnd(day_data['total_expense']) if day_data['total_expense'] > 0 else "-",
+                        _fmt_vnd(day_data['total_income']) if day_data['total_income'] > 0 else "-",
+                        f"{day_data['transaction_count']} lần"
+                    )
+                
+                console.print(Panel(daily_table, title="📈 CHI TIẾT THEO NGÀY", padding=(1, 2)))
+                
+                # Hiển thị số dư
+                console.print(_balance_panel(balance))
             
         elif period == "monthly":
-            console.print("📅 Lấy thống kê tháng...")
-            
-            # Lấy tổng thống kê tháng
-            summary = tracker.db.get_spending_summary(1, 30)
-            weekly_data = tracker.db.get_monthly_summary_by_weeks()
+            weekly_data = bundle['details']
             
             # Bảng tổng quan
-            stats_table = Table(box=box.DOUBLE_EDGE)
-            stats_table.add_column("📅 Thống kê", style="cyan")
-            stats_table.add_column("Giá trị", style="green", justify="right")
-            
-            stats_table.add_row("📅 Thời gian", "30 NGÀY QUA")
-            stats_table.add_row("💸 Tổng chi tiêu", f"{summary['total_spent']:,.0f}đ" if summary['total_spent'] else "0đ")
-            stats_table.add_row("🔢 Số giao dịch", f"{summary['transaction_count']} lần")
+            stats_table = _overview_table(summary, time_label)
             
-            if summary['transaction_count'] > 0:
-                avg = summary['total_spent'] / summary['transaction_count']
-                stats_table.add_row("📊 Trung bình/lần", f"{avg:,.0f}đ")
-            
-            console.print(Panel(stats_table, title="📊 THỐNG KÊ THÁNG", padding=(1, 2)))
-            
-            # Bảng theo tuần
-            weekly_table = Table(show_header=True, header_style="bold magenta", box=box.SIMPLE)
-            weekly_table.add_column("Tuần", style="cyan")
-            weekly_table.add_column("Khoảng thời gian", style="dim")
-            weekly_table.add_column("Chi tiêu", style="red", justify="right")
-            weekly_table.add_column("Thu nhập", style="green", justify="right")
-            weekly_table.add_column("Giao dịch", style="blue", justify="center")
-            
-            for week_data in weekly_data:
-                start_date = datetime.datetime.strptime(week_data['start_date'], '%Y-%m-%d').strftime('%d/%m')
-                end_date = datetime.datetime.strptime(week_data['end_date'], '%Y-%m-%d').strftime('%d/%m')
+            with console:  # Gom output, ghi một lần trước khi hỏi y/n
+                console.print(Panel(stats_table, title=stats_title, padding=(1, 2)))
                 
-                weekly_table.add_row(
-                    f"Tuần {week_data['week_num']}",
-                    f"{start_date} - {end_date}",
-                    f"{week_data['total_expense']:,.0f}đ" if week_data['total_expense'] > 0 else "-",
-                    f"{week_data['total_income']:,.0f}đ" if week_data['total_income'] > 0 else "-",
-                    f"{week_data['transaction_count']} lần"
-                )
-            
-            console.print(Panel(weekly_table, title="📈 CHI TIẾT THEO TUẦN", padding=(1, 2)))
+                # Bảng theo tuần
+                weekly_table = Table(**_DETAIL_TABLE_STYLE)
+                weekly_table.add_column("Tuần", style="cyan")
+                weekly_table.add_column("Khoảng thời gian", style="dim")
+                weekly_table.add_column("Chi tiêu", style="red", justify="right")
+                weekly_table.add_column("Thu nhập", style="green", justify="right")
+                weekly_table.add_column("Giao dịch", style="blue", justify="center")
+                
+                for week_data in weekly_data:
+                    start_date = _short_date(week_data['start_date'])
+                    end_date = _short_date(week_data['end_date'])
+                    
+                    weekly_table.add_row(
+                        f"Tuần {week_data['week_num']}",
+                        f"{start_date} - {end_date}",
+                        _fmt_vnd(week_data['total_expense']) if week_data['total_expense'] > 0 else "-",
+                        _fmt_vnd(week_data['total_income']) if week_data['total_income'] > 0 else "-",
+                        f"{week_data['transaction_count']} lần"
+                    )
+                
+                console.print(Panel(weekly_table, title="📈 CHI TIẾT THEO TUẦN", padding=(1, 2)))
             
-            # Hỏi có muốn xem chi tiết 30 ngày + biểu đồ không
+            # Hỏi có muốn xem chi tiết 30 ngày + biểu đồ không (trừ khi đã chọn qua CLI)
             try:
-                choice = input("\n📊 Bạn có muốn xem chi tiết 30 ngày + biểu đồ không? (y/n): ").strip().lower()
+                if full is None:
+                    choice = _prompt("\n📊 Bạn có muốn xem chi tiết 30 ngày + biểu đồ không? (y/n): ").strip().lower()
+                    full = choice in ['y', 'yes', 'có']
                 
-                if choice in ['y', 'yes', 'có']:
+                if full:
                     console.print("📊 Đang tạo biểu đồ chi tiết...")
-                    show_monthly_chart(tracker)
-                    
-                    # Hiển thị chi tiết tháng hiện tại
+                    # Dữ liệu tháng hiện tại dùng chung cho biểu đồ và bảng chi tiết
                     monthly_data = tracker.db.get_current_month_summary_by_days(1)
                     
-                    console.print(f"\n📅 Chi tiết từng ngày trong tháng {datetime.datetime.now().month}/{datetime.datetime.now().year}:")
-                    
-                    # Hiển thị 10 ngày một lần để không quá dài
-                    for i in range(0, len(monthly_data), 10):
-                        chunk = monthly_data[i:i+10]
-                        
-                        daily_table = Table(show_header=True, header_style="bold magenta", box=box.SIMPLE)
-                        daily_table.add_column("Ngày", style="cyan")
-                        daily_table.add_column("Chi tiêu", style="red", justify="right")
-                        daily_table.add_column("Thu nhập", style="green", justify="right")
-                        daily_table.add_column("GD", style="blue", justify="center")
+                    # Vẽ biểu đồ ở thread riêng trong lúc in bảng chi tiết.
+                    # Thông báo của biểu đồ gom lại, in sau bảng để không chen vào output đang buffer
+                    chart_messages = []
+                    with ThreadPoolExecutor(max_workers=1) as executor:
+                        chart_future = executor.submit(
+                            show_monthly_chart, tracker, monthly_data, now, chart_format, chart_messages.append
+                        )
                         
-                        for day_data in chunk:
-                            date_obj = datetime.datetime.strptime(day_data['date'], '%Y-%m-%d')
-                            date_display = date_obj.strftime('%d/%m (%a)')
+                        with console:  # Gom bảng chi tiết, ghi ra stdout một lần
+                            console.print(f"\n📅 Chi tiết từng ngày trong tháng {now.month}/{now.year}:")
+                            
+                            # Một bảng cho cả tháng, kẻ ngang sau mỗi 10 ngày cho dễ đọc
+                            daily_table = _make_table(_DAY_COLUMNS, **_DETAIL_TABLE_STYLE)
+                            daily_table.add_column("GD", style="blue", justify="center")
                             
-                            daily_table.add_row(
-                                date_display,
-                                f"{day_data['total_expense']:,.0f}đ" if day_data['total_expense'] > 0 else "-",
-                                f"{day_data['total_income']:,.0f}đ" if day_data['total_income'] > 0 else "-",
-                                str(day_data['transaction_count']) if day_data['transaction_count'] > 0 else "-"
-                            )
+                            for i, day_data in enumerate(monthly_data):
+                                if i and i % 10 == 0:
+                                    daily_table.add_section()
+                                daily_table.add_row(
+                                    _day_label(day_data['date']),
+                                    _fmt_vnd(day_data['total_expense']) if day_data['total_expense'] > 0 else "-",
+                                    _fmt_vnd(day_data['total_income']) if day_data['total_income'] > 0 else "-",
+                                    str(day_data['transaction_count']) if day_data['transaction_count'] > 0 else "-"
+                                )
+                            
+                            title = f"📅 NGÀY 1-{len(monthly_data)} TRONG THÁNG"
+                            console.print(Panel(daily_table, title=title, padding=(1, 2)))
                         
-                        start_day = i + 1
-                        end_day = min(i + 10, len(monthly_data))
-                        title = f"📅 NGÀY {start_day}-{end_day} TRONG THÁNG"
-                        console.print(Panel(daily_table, title=title, padding=(1, 2)))
+                        chart_future.result()  # Chờ biểu đồ lưu/mở xong
+                    
+                    for message in chart_messages:
+                        print(message)
                 
             except (EOFError, KeyboardInterrupt):
                 console.print("\n💡 Đã bỏ qua chi tiết 30 ngày")
             
             # Hiển thị số dư
-            balance_content = f"""💵 Tiền mặt                 {balance['cash_balance']:,.0f}đ
-🏦 Tài khoản                {balance['account_balance']:,.0f}đ
-💰 Tổng cộng                {balance['cash_balance'] + balance['account_balance']:,.0f}đ"""
-            
-            console.print(Panel(balance_content, title="💰 SỐ DƯ HIỆN TẠI", padding=(1, 3)))
+            console.print(_balance_panel(balance))
             
     except Exception as e:
         console.print(f"❌ Lỗi: {e}")
 
-def show_monthly_chart(tracker):
-    """Tạo và hiển thị biểu đồ chi tiêu theo ngày trong tháng hiện tại"""
+def show_monthly_chart(tracker, monthly_data=None, now=None, chart_format="svg", report=print):
+    """Tạo và hiển thị biểu đồ chi tiêu theo ngày trong tháng hiện tại
+    
+    monthly_data: kết quả get_current_month_summary_by_days nếu đã lấy sẵn
+    now: thời điểm caller đang hiển thị, mặc định là lúc gọi hàm
+    chart_format: "svg" (vector, lưu nhanh) hoặc "png" (200 DPI)
+    report: nơi ghi thông báo trạng thái, mặc định in thẳng ra stdout
+    """
     try:
-        import matplotlib
-        matplotlib.use('Agg')  # Backend không cần GUI, chỉ để save file
-        import matplotlib.pyplot as plt
-        import matplotlib.dates as mdates
-        from datetime import datetime, timedelta
-        import os
-        import subprocess
+        plt, mdates, np = _plotting()
         
-        print("📊 Đang tạo biểu đồ...")
+        report("📊 Đang tạo biểu đồ...")
         
         # Tạo folder để lưu charts
         charts_folder = "expense_charts"
         if not os.path.exists(charts_folder):
             os.makedirs(charts_folder)
         
-        # Lấy dữ liệu tháng hiện tại
-        monthly_data = tracker.db.get_current_month_summary_by_days(1)
+        # Lấy dữ liệu tháng hiện tại (nếu caller chưa lấy)
+        if monthly_data is None:
+            monthly_data = tracker.db.get_current_month_summary_by_days(1)
         
         # Chuẩn bị dữ liệu cho biểu đồ
-        dates = []
-        expenses = []
-        incomes = []
-        
-        for day_data in monthly_data:
-            date_obj = datetime.strptime(day_data['date'], '%Y-%m-%d')
-            dates.append(date_obj)
-            expenses.append(day_data['total_expense'])
-            incomes.append(day_data['total_income'])
+        day_count = len(monthly_data)
+        dates = [_parse_iso_date(day_data['date']) for day_data in monthly_data]
+        expenses = np.fromiter((d['total_expense'] for d in monthly_data), dtype=np.float64, count=day_count)
+        incomes = np.fromiter((d['total_income'] for d in monthly_data), dtype=np.float64, count=day_count)
         
         # Tạo tên file với tháng/năm
-        current_month = datetime.now()
+        current_month = now or datetime.datetime.now()
         month_year = current_month.strftime('%Y-%m')
-        chart_filename = f"spending_chart_{month_year}.png"
+        chart_filename = f"spending_chart_{month_year}.{chart_format}"
         chart_path = os.path.join(charts_folder, chart_filename)
         
         # Title với tháng/năm cụ thể
-        month_name_vn = {
-            1: "Tháng 1", 2: "Tháng 2", 3: "Tháng 3", 4: "Tháng 4",
-            5: "Tháng 5", 6: "Tháng 6", 7: "Tháng 7", 8: "Tháng 8", 
-            9: "Tháng 9", 10: "Tháng 10", 11: "Tháng 11", 12: "Tháng 12"
-        }
-        month_vn = month_name_vn[current_month.month]
-        
-        # Tạo biểu đồ với kích thước lớn hơn
-        fig = plt.figure(figsize=(16, 10))
+        month_vn = _MONTH_VN[current_month.month]
         
-        # Subplot cho chi tiêu
-        plt.subplot(2, 1, 1)
-        plt.plot(dates, expenses, 'r-', linewidth=2, label='Chi tiêu', marker='o', markersize=4)
-        plt.title(f'Chi tiêu theo Ngày - {month_vn}/{current_month.year}', fontsize=16, fontweight='bold')
-        plt.ylabel('Số tiền (VNĐ)', fontsize=12)
-        plt.grid(True, alpha=0.3)
-        plt.legend()
-        
-        # Format trục x - hiển thị ngày trong tháng
-        plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%d'))
-        plt.gca().xaxis.set_major_locator(mdates.DayLocator(interval=2))  # Mỗi 2 ngày
-        plt.xticks(rotation=45)
-        
-        # Format trục y để hiển thị số tiền đẹp
-        plt.gca().yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{x:,.0f}đ'))
-        
-        # Subplot cho thu nhập
-        plt.subplot(2, 1, 2)
-        plt.plot(dates, incomes, 'g-', linewidth=2, label='Thu nhập', marker='s', markersize=4)
-        plt.title(f'Thu nhập theo Ngày - {month_vn}/{current_month.year}', fontsize=16, fontweight='bold')
-        plt.xlabel('Ngày trong tháng', fontsize=12)
-        plt.ylabel('Số tiền (VNĐ)', fontsize=12)
-        plt.grid(True, alpha=0.3)
-        plt.legend()
-        
-        # Format trục x
-        plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%d'))
-        plt.gca().xaxis.set_major_locator(mdates.DayLocator(interval=2))
-        plt.xticks(rotation=45)
-        
-        # Format trục y
-        plt.gca().yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{x:,.0f}đ'))
-        
-        plt.tight_layout(pad=3.0)
-        
-        # Lưu biểu đồ với DPI cao
-        plt.savefig(chart_path, dpi=200, bbox_inches='tight', facecolor='white')
-        plt.close()  # Đóng figure để tiết kiệm memory
+        data_key = _chart_data_key(monthly_data)
+        if _is_chart_current(chart_path, data_key):
+            report("♻️ Dữ liệu tháng chưa đổi - dùng lại biểu đồ đã lưu")
+        else:
+            # Tạo biểu đồ với kích thước lớn hơn - chi tiêu ở trên, thu nhập ở dưới
+            fig, axes = plt.subplots(2, 1, figsize=(16, 10))
+            series = (
+                (expenses, 'r-', 'o', 'Chi tiêu'),
+                (incomes, 'g-', 's', 'Thu nhập'),
+            )
+            
+            for ax, (values, line_style, marker, label) in zip(axes, series):
+                ax.plot(dates, values, line_style, linewidth=2, label=label, marker=marker, markersize=4)
+                ax.set_title(f'{label} theo Ngày - {month_vn}/{current_month.year}', fontsize=16, fontweight='bold')
+                ax.set_ylabel('Số tiền (VNĐ)', fontsize=12)
+                ax.grid(True, alpha=0.3)
+                ax.legend()
+                
+                # Trục x hiển thị ngày trong tháng (mỗi 2 ngày), trục y hiển thị số tiền.
+                # Locator/formatter giữ tham chiếu tới axis nên mỗi trục cần instance riêng
+                ax.xaxis.set_major_formatter(mdates.DateFormatter('%d'))
+                ax.xaxis.set_major_locator(mdates.DayLocator(interval=2))
+                ax.tick_params(axis='x', labelrotation=45)
+                ax.yaxis.set_major_formatter(plt.FuncFormatter(_format_vnd_tick))
+            
+            axes[-1].set_xlabel('Ngày trong tháng', fontsize=12)
+            
+            fig.tight_layout(pad=3.0)
+            
+            # SVG không cần rasterize; PNG lưu với DPI cao.
+            # tight_layout đã căn lề nên không cần bbox_inches='tight' (tính bounding box lần nữa)
+            save_kwargs = {'dpi': 200} if chart_format == 'png' else {}
+            fig.savefig(chart_path, facecolor='white', **save_kwargs)
+            plt.close(fig)  # Đóng figure để tiết kiệm memory
+            _remember_chart(chart_path, data_key)
         
         # Mở biểu đồ bằng image viewer mặc định của hệ thống
-        print(f"📊 Mở biểu đồ {month_vn}/{current_month.year}...")
-        try:
-            subprocess.run(['xdg-open', chart_path], check=True)
-            print("✅ Đã mở biểu đồ thành công!")
-        except subprocess.CalledProcessError:
-            print("❌ Không thể mở biểu đồ, hãy mở file manually")
-        except FileNotFoundError:
-            # Fallback cho hệ thống không có xdg-open
-            try:
-                subprocess.run(['open', chart_path], check=True)  # macOS
-                print("✅ Đã mở biểu đồ thành công! (macOS)")
-            except:
-                print("❌ Không thể mở biểu đồ tự động")
+        report(f"📊 Mở biểu đồ {month_vn}/{current_month.year}...")
+        if _open_file(chart_path):
+            report("✅ Đã mở biểu đồ thành công!")
+        else:
+            report("❌ Không thể mở biểu đồ tự động, hãy mở file manually")
         
         # Thông báo đường dẫn file
-        print(f"\n✅ Biểu đồ {month_vn}/{current_month.year} đã được lưu tại: {chart_path}")
-        print(f"📁 Thư mục charts: {os.path.abspath(charts_folder)}")
+        report(f"\n✅ Biểu đồ {month_vn}/{current_month.year} đã được lưu tại: {chart_path}")
+        report(f"📁 Thư mục charts: {os.path.abspath(charts_folder)}")
         
         # Hiển thị thông tin tóm tắt
-        total_expense = sum(expenses)
-        total_income = sum(incomes) 
-        days_with_expense = len([e for e in expenses if e > 0])
-        days_with_income = len([i for i in incomes if i > 0])
+        total_expense = expenses.sum()
+        total_income = incomes.sum()
+        days_with_expense = int((expenses > 0).sum())
+        days_with_income = int((incomes > 0).sum())
         
-        print(f"\n📈 Tóm tắt {month_vn}/{current_month.year}:")
-        print(f"   💸 Tổng chi tiêu: {total_expense:,.0f}đ")
-        print(f"   💰 Tổng thu nhập: {total_income:,.0f}đ")
-        print(f"   📅 Ngày có chi tiêu: {days_with_expense}/{len(dates)} ngày")
-        print(f"   📅 Ngày có thu nhập: {days_with_income}/{len(dates)} ngày")
+        report(f"\n📈 Tóm tắt {month_vn}/{current_month.year}:")
+        report(f"   💸 Tổng chi tiêu: {_fmt_vnd(total_expense)}")
+        report(f"   💰 Tổng thu nhập: {_fmt_vnd(total_income)}")
+        report(f"   📅 Ngày có chi tiêu: {days_with_expense}/{len(dates)} ngày")
+        report(f"   📅 Ngày có thu nhập: {days_with_income}/{len(dates)} ngày")
         
     except ImportError:
-        print("⚠️ Cần cài đặt matplotlib: uv add matplotlib")
+        report("⚠️ Cần cài đặt matplotlib: uv add matplotlib")
     except Exception as e:
-        print(f"❌ Lỗi tạo biểu đồ: {e}")
+        report(f"❌ Lỗi tạo biểu đồ: {e}")
         import traceback
         traceback.print_exc()
 
 
 def handle_llm_config(model_name: str):
     """Xử lý cấu hình mô hình LLM"""
-    console = Console()
+    console = _console()
     
     # Hiển thị mô hình hiện tại
     current_model = get_current_model()
@@ -547,7 +712,7 @@ def handle_llm_config(model_name: str):
     available_models = list_available_models()
     
     console.print("\n📋 Mô hình có sẵn:")
-    models_table = Table(show_header=True, header_style="bold magenta", box=box.SIMPLE)
+    models_table = Table(**_DETAIL_TABLE_STYLE)
     models_table.add_column("Tên", style="cyan")
     models_table.add_column("Provider", style="green")
     models_table.add_column("Model Name", style="yellow")
@@ -603,6 +768,11 @@ def main():
         handle_llm_config(args.llm)
         return
     
+    if args.daemon:
+        from expense_daemon import serve
+        serve(_tracker())
+        return
+    
     # Handle CLI operations
     if args.append:
         quick_add_expense(args.append)
@@ -621,19 +791,23 @@ def main():
         return
         
     if args.stats_monthly:
-        show_statistics('monthly') 
+        full = True if args.full else False if args.no_chart else None
+        if full is not False:
+            _prewarm_plotting()
+        show_statistics('monthly', full=full, chart_format='png' if args.png else 'svg')
         return
 
     # Default: Start interactive mode
     try:
+        from chatbot import ExpenseChatbot
         chatbot = ExpenseChatbot()
         chatbot.start()
     except KeyboardInterrupt:
-        console = Console()
+        console = _console()
         console.print("\n[yellow]👋 Đã thoát ứng dụng![/yellow]")
         sys.exit(0)
     except Exception as e:
-        console = Console()
+        console = _console()
         console.print(f"[red]❌ Lỗi: {str(e)}[/red]")
         sys.exit(1)
 
@@ -6,120 +6,211 @@ Giúp kiểm tra và setup Google Sheets integration
 
 import os
 import sys
-from rich.console import Console
-from rich.panel import Panel
-from rich.table import Table
-from rich import box
-from dotenv import load_dotenv
+import json
+import hashlib
+import datetime
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
-# Load environment
-load_dotenv()
+# Access token đã lấy được lưu lại để lần chạy sau khỏi đổi token với Google
+_TOKEN_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "expense_assistant")
+_TOKEN_EXPIRY_MARGIN = datetime.timedelta(seconds=30)
 
-def main():
-    console = Console()
+_SCOPE = (
+    'https://spreadsheets.google.com/feeds',
+    'https://www.googleapis.com/auth/drive'
+)
+_DRIVE_ABOUT_URL = "https://www.googleapis.com/drive/v3/about"
+
+
+def _stat_credentials(path):
+    """os.stat file credentials (một syscall cho cả tồn tại lẫn kích thước), None nếu không dùng được"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat if stat.st_size > 0 else None
+
+
+@lru_cache(maxsize=None)
+def _service_account_credentials(creds_path, mtime_ns, scope):
+    """Parse key file (RSA) một lần mỗi process - mtime_ns trong key để file đổi thì parse lại
+    
+    File trỏ bởi GOOGLE_APPLICATION_CREDENTIALS đi qua google.auth.default() (ADC);
+    file khác hoặc ADC lỗi thì đọc trực tiếp bằng from_service_account_info.
+    """
+    import google.auth
+    from google.auth.exceptions import DefaultCredentialsError
+    from google.oauth2.service_account import Credentials
     
-    console.print(Panel(
-        "🔧 GOOGLE SHEETS SETUP & TEST TOOL",
-        subtitle="Kiểm tra và setup Google Sheets integration",
-        border_style="cyan"
-    ))
+    env_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
+    if env_path and os.path.abspath(env_path) == creds_path:
+        try:
+            credentials, _ = google.auth.default(scopes=scope)
+            return credentials
+        except DefaultCredentialsError:
+            pass
     
-    # Bước 1: Kiểm tra dependencies
-    console.print("\n[yellow]📦 Bước 1: Kiểm tra dependencies...[/yellow]")
+    # Đọc + parse JSON một lần (from_service_account_file tự mở lại file)
+    with open(creds_path, 'rb') as f:
+        info = json.load(f)
+    return Credentials.from_service_account_info(info, scopes=scope)
+
+
+def get_cached_credentials(creds_path, scope, stat=None):
+    """Credentials của service account, dùng lại access token còn hạn đã lưu trên đĩa
+    
+    stat: kết quả os.stat(creds_path) nếu caller đã có
+    Returns: (credentials, from_cache) - from_cache=True thì key file chưa được đọc/kiểm tra
+    """
+    from google.oauth2 import credentials as oauth2_credentials
+    from google.auth.transport.requests import Request
+    
+    # Key theo file credentials (đường dẫn + mtime) và scope - đổi key file là lấy token mới
+    if stat is None:
+        stat = os.stat(creds_path)
+    key_source = f"{os.path.abspath(creds_path)}|{stat.st_mtime_ns}|{' '.join(scope)}"
+    cache_file = os.path.join(_TOKEN_CACHE_DIR, f"token_{hashlib.sha256(key_source.encode()).hexdigest()[:16]}.json")
+    # google-auth dùng expiry dạng UTC không có tzinfo
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
     
     try:
-        import gspread
-        from google.oauth2.service_account import Credentials
-        console.print("✅ Google Sheets dependencies đã cài đặt")
-    except ImportError:
-        console.print("[red]❌ Thiếu dependencies[/red]")
-        console.print("[yellow]💡 Chạy: uv add gspread google-auth[/yellow]")
-        return
+        with open(cache_file, encoding='utf-8') as f:
+            cached = json.load(f)
+        expiry = datetime.datetime.fromisoformat(cached['expiry'])
+        if expiry - now > _TOKEN_EXPIRY_MARGIN:
+            return oauth2_credentials.Credentials(token=cached['token'], expiry=expiry, scopes=scope), True
+    except (OSError, ValueError, KeyError):
+        pass  # Chưa có cache / cache hỏng -> lấy token mới
     
-    # Bước 2: Kiểm tra credentials
-    console.print("\n[yellow]📁 Bước 2: Kiểm tra credentials...[/yellow]")
+    credentials = _service_account_credentials(os.path.abspath(creds_path), stat.st_mtime_ns, tuple(scope))
+    credentials.refresh(Request())
+    
+    try:
+        os.makedirs(_TOKEN_CACHE_DIR, exist_ok=True)
+        # Token là bearer token - chỉ user hiện tại được đọc
+        fd = os.open(cache_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'token': credentials.token, 'expiry': credentials.expiry.isoformat()}, f)
+    except OSError:
+        pass  # Không lưu được cache thì lần sau lấy token lại
     
-    # Kiểm tra GOOGLE_APPLICATION_CREDENTIALS
-    creds_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-    if creds_path:
-        if os.path.exists(creds_path):
-            console.print(f"✅ GOOGLE_APPLICATION_CREDENTIALS: {creds_path}")
+    return credentials, False
+
+
+def main():
+    # Import muộn: chạy lỗi sớm (thiếu dependencies/credentials) không phải trả chi phí import
+    from rich.console import Console
+    from rich.panel import Panel
+    
+    console = Console()
+    
+    # Bước 1-2 chỉ kiểm tra cục bộ: gom output, ghi ra stdout một lần trước khi gọi mạng ở Bước 3
+    with console:
+        console.print(Panel(
+            "🔧 GOOGLE SHEETS SETUP & TEST TOOL",
+            subtitle="Kiểm tra và setup Google Sheets integration",
+            border_style="cyan"
+        ))
+        
+        # Bước 1: Kiểm tra dependencies
+        console.print("\n[yellow]📦 Bước 1: Kiểm tra dependencies...[/yellow]")
+        
+        # Chỉ kiểm tra có cài hay không - gspread/google-auth import ở Bước 3
+        try:
+            dependencies_found = all(importlib.util.find_spec(name) for name in ("gspread", "google.oauth2"))
+        except ImportError:
+            dependencies_found = False  # Thiếu cả package cha "google"
+        
+        if dependencies_found:
+            console.print("✅ Google Sheets dependencies đã cài đặt")
         else:
-            console.print(f"[red]❌ File không tồn tại: {creds_path}[/red]")
-            console.print("[yellow]💡 Kiểm tra đường dẫn trong file .env[/yellow]")
+            console.print("[red]❌ Thiếu dependencies[/red]")
+            console.print("[yellow]💡 Chạy: uv add gspread google-auth[/yellow]")
             return
-    else:
-        # Kiểm tra credentials.json
-        if os.path.exists('credentials.json'):
-            console.print("✅ Tìm thấy credentials.json")
-            creds_path = 'credentials.json'
+        
+        # Load environment - sau khi chắc chắn đủ dependencies
+        from dotenv import load_dotenv
+        load_dotenv()
+        
+        # Bước 2: Kiểm tra credentials
+        console.print("\n[yellow]📁 Bước 2: Kiểm tra credentials...[/yellow]")
+        
+        # Kiểm tra GOOGLE_APPLICATION_CREDENTIALS
+        creds_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
+        if creds_path:
+            creds_stat = _stat_credentials(creds_path)
+            if creds_stat:
+                console.print(f"✅ GOOGLE_APPLICATION_CREDENTIALS: {creds_path}")
+            else:
+                console.print(f"[red]❌ File không tồn tại hoặc rỗng: {creds_path}[/red]")
+                console.print("[yellow]💡 Kiểm tra đường dẫn trong file .env[/yellow]")
+                return
         else:
-            console.print("[red]❌ Không tìm thấy credentials[/red]")
-            show_setup_guide(console)
-            return
+            # Kiểm tra credentials.json
+            creds_stat = _stat_credentials('credentials.json')
+            if creds_stat:
+                console.print("✅ Tìm thấy credentials.json")
+                creds_path = 'credentials.json'
+            else:
+                console.print("[red]❌ Không tìm thấy credentials[/red]")
+                show_setup_guide(console)
+                return
+        
+        # Bước 3: Test connection
+        console.print("\n[yellow]🔗 Bước 3: Test kết nối Google Sheets...[/yellow]")
     
-    # Bước 3: Test connection
-    console.print("\n[yellow]🔗 Bước 3: Test kết nối Google Sheets...[/yellow]")
+    # Lấy token (round-trip tới Google) ở thread riêng trong lúc import gspread
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        credentials_future = executor.submit(get_cached_credentials, creds_path, _SCOPE, creds_stat)
+        
+        import gspread
+        from gspread.exceptions import APIError
     
     try:
-        # Setup credentials
-        scope = [
-            'https://spreadsheets.google.com/feeds',
-            'https://www.googleapis.com/auth/drive'
-        ]
-        
-        credentials = Credentials.from_service_account_file(creds_path, scopes=scope)
+        credentials, from_cache = credentials_future.result()
         gc = gspread.authorize(credentials)
         
-        console.print("✅ Credentials hợp lệ")
+        if from_cache:
+            console.print("✅ Dùng token đã cache (chưa đọc lại file credentials)")
+        else:
+            console.print("✅ Credentials hợp lệ")
         
-        # Test tạo/mở spreadsheet
-        spreadsheet_name = "Expense Tracker Test"
+        # Test Drive API bằng một request chỉ đọc (about.get) - không tạo/xóa file, không tốn quota.
+        # Thành công nghĩa là credentials dùng được và Google Drive API đã bật
+        about = gc.http_client.request("get", _DRIVE_ABOUT_URL, params={"fields": "user,storageQuota"}).json()
+        console.print(f"✅ Google Drive API hoạt động - service account: {about['user'].get('emailAddress', 'N/A')}")
         
-        try:
-            spreadsheet = gc.open(spreadsheet_name)
-            console.print(f"✅ Đã kết nối với spreadsheet: {spreadsheet_name}")
-        except:
-            # Thử tạo mới
-            try:
-                spreadsheet = gc.create(spreadsheet_name)
-                console.print(f"✅ Đã tạo spreadsheet test: {spreadsheet_name}")
-                
-                # Xóa test spreadsheet sau khi tạo thành công
-                import time
-                time.sleep(1)
-                gc.del_spreadsheet_by_key(spreadsheet.id)
-                console.print("✅ Đã xóa spreadsheet test")
-                
-            except Exception as e:
-                console.print(f"[red]❌ Lỗi tạo spreadsheet: {e}[/red]")
-                
-                # Kiểm tra specific errors
-                if "403" in str(e) and "Google Drive API" in str(e):
-                    show_drive_api_guide(console)
-                else:
-                    console.print(f"[red]Lỗi: {e}[/red]")
-                return
+        quota = about.get('storageQuota', {})
+        if 'limit' in quota and int(quota.get('usage', 0)) >= int(quota['limit']):
+            console.print("[red]❌ Drive của service account đã hết dung lượng - không tạo được spreadsheet mới[/red]")
+            return
         
         console.print("\n[green]🎉 Google Sheets integration hoạt động hoàn hảo![/green]")
         
         # Hiển thị thông tin spreadsheet sẽ được tạo
         show_success_info(console)
         
-    except Exception as e:
+    except APIError as e:
         console.print(f"[red]❌ Lỗi kết nối: {e}[/red]")
         
-        if "403" in str(e) and "Google Drive API" in str(e):
+        # Dùng status code/message có cấu trúc của response thay vì tìm chuỗi trong str(e)
+        status = e.response.status_code
+        if status == 403 and "Google Drive API" in e.error.get("message", ""):
             show_drive_api_guide(console)
-        elif "404" in str(e):
+        elif status == 404:
             console.print("[yellow]💡 Có thể service account không có quyền truy cập[/yellow]")
         else:
             console.print("[yellow]💡 Kiểm tra internet connection và credentials[/yellow]")
+    except Exception as e:
+        # Lỗi mạng / lấy token - không có response từ API
+        console.print(f"[red]❌ Lỗi kết nối: {e}[/red]")
+        console.print("[yellow]💡 Kiểm tra internet connection và credentials[/yellow]")
 
 
-def show_setup_guide(console):
-    """Hiển thị hướng dẫn setup credentials"""
-    guide = """
+# Nội dung các panel hướng dẫn (rich markup)
+_SETUP_GUIDE = """
 [bold cyan]📋 HƯỚNG DẪN SETUP CREDENTIALS[/bold cyan]
 
 [yellow]🔗 Bước 1: Tạo Google Cloud Project[/yellow]
@@ -145,13 +236,8 @@ def show_setup_guide(console):
 • Sheets API: https://console.cloud.google.com/apis/library/sheets.googleapis.com
 • Drive API: https://console.cloud.google.com/apis/library/drive.googleapis.com
     """
-    
-    console.print(Panel(guide, title="📋 SETUP GUIDE", border_style="yellow"))
-
 
-def show_drive_api_guide(console):
-    """Hiển thị hướng dẫn enable Google Drive API"""
-    guide = """
+_DRIVE_API_GUIDE = """
 [bold red]⚠️  GOOGLE DRIVE API CHƯA ĐƯỢC KÍCH HOẠT[/bold red]
 
 [yellow]🔧 Cách khắc phục:[/yellow]
@@ -172,13 +258,8 @@ def show_drive_api_guide(console):
 • Có thể mất 1-2 phút để propagate
 • Đảm bảo chọn đúng project ID
     """
-    
-    console.print(Panel(guide, title="🔧 DRIVE API SETUP", border_style="red"))
-
 
-def show_success_info(console):
-    """Hiển thị thông tin sau khi setup thành công"""
-    info = """
+_SUCCESS_INFO = """
 [bold green]🎉 GOOGLE SHEETS ĐÃ SẴN SÀNG![/bold green]
 
 [yellow]📊 Các worksheet sẽ được tạo:[/yellow]
@@ -196,8 +277,28 @@ def show_success_info(console):
 • ea "test sheets hoạt động 25k"
 • expense (interactive mode)
     """
-    
-    console.print(Panel(info, title="✅ SUCCESS", border_style="green"))
+
+
+@lru_cache(maxsize=None)
+def _guide_panel(content, title, border_style):
+    """Panel hướng dẫn - mỗi nội dung chỉ dựng một lần"""
+    from rich.panel import Panel
+    return Panel(content, title=title, border_style=border_style)
+
+
+def show_setup_guide(console):
+    """Hiển thị hướng dẫn setup credentials"""
+    console.print(_guide_panel(_SETUP_GUIDE, "📋 SETUP GUIDE", "yellow"))
+
+
+def show_drive_api_guide(console):
+    """Hiển thị hướng dẫn enable Google Drive API"""
+    console.print(_guide_panel(_DRIVE_API_GUIDE, "🔧 DRIVE API SETUP", "red"))
+
+
+def show_success_info(console):
+    """Hiển thị thông tin sau khi setup thành công"""
+    console.print(_guide_panel(_SUCCESS_INFO, "✅ SUCCESS", "green"))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,44 @@
+"""Kiểm tra fast path rule-based của ExpenseExtractor (chạy: python -m unittest)"""
+import importlib.util
+import unittest
+from unittest import mock
+
+LANGCHAIN_AVAILABLE = importlib.util.find_spec("langchain") is not None
+
+if LANGCHAIN_AVAILABLE:
+    import llm_processor
+
+
+@unittest.skipUnless(LANGCHAIN_AVAILABLE, "cần cài langchain")
+class QuickExpenseExtractionTest(unittest.TestCase):
+    def setUp(self):
+        # Giả lập LLM online mà không tạo client thật
+        self.extractor = llm_processor.ExpenseExtractor.__new__(llm_processor.ExpenseExtractor)
+        self.extractor.llm = object()
+        patcher = mock.patch.object(llm_processor, "_online_llm", return_value=self.extractor.llm)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache_patcher = mock.patch.object(llm_processor, "_get_cached_response", return_value=None)
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+
+    def test_clear_expense_skips_llm(self):
+        result = self.extractor._quick_expense_extraction("phở 35k")
+        self.assertIsNotNone(result)
+        self.assertEqual(result['transaction_type'], 'expense')
+        self.assertEqual(result['price'], 35000)
+
+    def test_income_goes_to_llm(self):
+        for message in ("lương 5tr", "lương 5tr ck", "thưởng 2tr"):
+            with self.subTest(message=message):
+                self.assertIn('income', llm_processor._scan_message(message).hits)
+                self.assertIsNone(self.extractor._quick_expense_extraction(message))
+
+    def test_income_offline_fallback(self):
+        result = self.extractor._fallback_extraction("thưởng 2tr")
+        self.assertEqual(result['transaction_type'], 'income')
+        self.assertEqual(result['price'], 2000000)
+
+
+if __name__ == "__main__":
+    unittest.main()